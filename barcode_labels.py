@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+"""
+barcode_labels.py
+
+Batch generator for the KSK barcode labels in Barcodes/.
+
+Reads the KSK list from ksk_table.csv (or a compiled ksk_pmod.json) and
+renders one Code 128 GIF per KSKNr, in the same format as the existing
+hand-made labels (subset C, 2 px modules, 202 x 100 for a 12-digit KSK,
+digits printed under the bars). Rendering is spread over a process pool.
+
+Outputs are cached by content hash: Barcodes/manifest.json records the
+hash of every label's content and render settings, so a re-run after a
+weekly import only renders KSKs that are new or changed. GIFs that are
+not in the manifest (hand-made ones) are left alone unless --force.
+
+--sheet writes all labels of the run into one multi-page A4 PDF for
+printing. Bars are drawn as vector rectangles, so it prints sharply.
+
+Only the standard library is used.
+
+Usage:
+    python barcode_labels.py [ksk_table.csv | ksk_pmod.json] [--out Barcodes]
+                             [--workers N] [--sheet labels.pdf] [--force]
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+barcodes_dir = 'Barcodes'
+manifest_name = 'manifest.json'
+
+RENDER_VERSION = 1
+MODULE_WIDTH = 2    # pixels per module
+BAR_HEIGHT = 76     # pixels
+LABEL_HEIGHT = 100  # pixels, bars + human-readable line
+
+# Code 128 symbol widths (bar, space, bar, ...), values 0..106
+CODE128_WIDTHS = (
+    "212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 "
+    "221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 "
+    "221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 "
+    "212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 "
+    "231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 "
+    "231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 "
+    "314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 "
+    "112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 "
+    "111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 "
+    "214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 "
+    "114131 311141 411131 211412 211214 211232 2331112"
+).split()
+START_B, START_C, STOP = 104, 105, 106
+
+# 5 x 7 digits for the human-readable line, drawn at 2x
+DIGITS_5X7 = {
+    "0": ("01110", "10001", "10011", "10101", "11001", "10001", "01110"),
+    "1": ("00100", "01100", "00100", "00100", "00100", "00100", "01110"),
+    "2": ("01110", "10001", "00001", "00010", "00100", "01000", "11111"),
+    "3": ("11110", "00001", "00001", "01110", "00001", "00001", "11110"),
+    "4": ("00010", "00110", "01010", "10010", "11111", "00010", "00010"),
+    "5": ("11111", "10000", "11110", "00001", "00001", "10001", "01110"),
+    "6": ("00110", "01000", "10000", "11110", "10001", "10001", "01110"),
+    "7": ("11111", "00001", "00010", "00100", "01000", "01000", "01000"),
+    "8": ("01110", "10001", "10001", "01110", "10001", "10001", "01110"),
+    "9": ("01110", "10001", "10001", "01111", "00001", "00010", "01100"),
+}
+
+
+def code128_values(data):
+    """Symbol values including start and check symbol (subset C for even digit runs, else B)."""
+    if data.isdigit() and len(data) % 2 == 0:
+        values = [START_C] + [int(data[i:i + 2]) for i in range(0, len(data), 2)]
+    else:
+        if any(not 32 <= ord(c) < 128 for c in data):
+            raise ValueError(f"Cannot encode {data!r} in Code 128 subset B.")
+        values = [START_B] + [ord(c) - 32 for c in data]
+    checksum = (values[0] + sum(i * value for i, value in enumerate(values[1:], 1))) % 103
+    return values + [checksum]
+
+
+def code128_modules(data):
+    """Return the barcode as a string of '1' (bar) and '0' (space) modules."""
+    modules = []
+    for value in code128_values(data) + [STOP]:
+        for i, width in enumerate(CODE128_WIDTHS[value]):
+            modules.append(("1" if i % 2 == 0 else "0") * int(width))
+    return "".join(modules)
+
+
+def render_pixels(text, module_width=MODULE_WIDTH, bar_height=BAR_HEIGHT, height=LABEL_HEIGHT):
+    """Rows of 0 (white) / 1 (black) pixels: bars, then the digits centred below."""
+    bar_row = [int(m) for m in code128_modules(text) for _ in range(module_width)]
+    width = len(bar_row)
+    rows = [bar_row] * bar_height
+    rows += [[0] * width for _ in range(height - bar_height)]
+
+    glyphs = [DIGITS_5X7[c] for c in text if c in DIGITS_5X7]
+    scale, advance = 2, 12
+    left = (width - len(glyphs) * advance + (advance - 5 * scale)) // 2
+    top = bar_height + 4
+    for n, glyph in enumerate(glyphs):
+        for gy, line in enumerate(glyph):
+            for gx, bit in enumerate(line):
+                if bit == "1":
+                    for dy in range(scale):
+                        row = rows[top + gy * scale + dy]
+                        x = left + n * advance + gx * scale
+                        if 0 <= x and x + scale <= width:
+                            row[x:x + scale] = [1] * scale
+    return rows
+
+
+def lzw_encode(pixels, min_code_size=2):
+    """GIF LZW compression of a flat pixel sequence (bytes)."""
+    clear, end = 1 << min_code_size, (1 << min_code_size) + 1
+
+    # First pass: the code sequence. Table keys are prefix code << 8 | pixel.
+    codes = [clear]
+    table = {}
+    lookup = table.get
+    next_code = end + 1
+    prefix = pixels[0]
+    for pixel in pixels[1:]:
+        key = (prefix << 8) | pixel
+        code = lookup(key)
+        if code is not None:
+            prefix = code
+            continue
+        codes.append(prefix)
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+        else:
+            codes.append(clear)
+            table.clear()
+            next_code = end + 1
+        prefix = pixel
+    codes.append(prefix)
+    codes.append(end)
+
+    # Second pass: pack with the code size the decoder will be using
+    out = bytearray()
+    buffer = nbits = 0
+    next_code, size = end + 1, min_code_size + 1
+    first = True
+    for code in codes:
+        buffer |= code << nbits
+        nbits += size
+        while nbits >= 8:
+            out.append(buffer & 0xFF)
+            buffer >>= 8
+            nbits -= 8
+        if code == clear:
+            next_code, size, first = end + 1, min_code_size + 1, True
+        elif code != end:
+            # The decoder adds an entry for every code except the first after a clear
+            if not first and next_code < 4096:
+                next_code += 1
+                if next_code == (1 << size) and size < 12:
+                    size += 1
+            first = False
+    if nbits:
+        out.append(buffer & 0xFF)
+    return bytes(out)
+
+
+def encode_gif(rows):
+    """Two-colour (white, black) GIF89a of rows of 0/1 pixels."""
+    height, width = len(rows), len(rows[0])
+    data = lzw_encode(b"".join(bytes(row) for row in rows))
+    blocks = b"".join(bytes([len(data[i:i + 255])]) + data[i:i + 255] for i in range(0, len(data), 255))
+    return (b"GIF89a" + struct.pack('<HHBBB', width, height, 0x80, 0, 0)
+            + b"\xff\xff\xff\x00\x00\x00"
+            + b"\x2c" + struct.pack('<HHHHB', 0, 0, width, height, 0)
+            + b"\x02" + blocks + b"\x00\x3b")
+
+
+def content_hash(ksk):
+    """Hash of everything that determines a label's pixels."""
+    key = f"{RENDER_VERSION}|{ksk}|{MODULE_WIDTH}|{BAR_HEIGHT}|{LABEL_HEIGHT}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def render_batch(out_dir, ksks):
+    """Worker: render and write the GIFs of a batch; return [(ksk, hash)]."""
+    done = []
+    for ksk in ksks:
+        path = os.path.join(out_dir, f"{ksk}.gif")
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_gif(render_pixels(ksk)))
+        os.replace(tmp_path, path)
+        done.append((ksk, content_hash(ksk)))
+    return done
+
+
+def read_catalog(path):
+    """Return [(KSKNr, PMOD)] from ksk_table.csv or ksk_pmod.json, in file order."""
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return [(ksk, (entry or {}).get("pmod", "")) for ksk, entry in json.load(f).items()]
+    catalog = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            ksk = (row.get("KSKNr") or "").strip()
+            if ksk:
+                catalog.append((ksk, (row.get("Ident") or "").strip()))
+    return catalog
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, manifest_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"Ignoring unreadable label manifest: {e}")
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, manifest_name)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def generate(ksks, out_dir=barcodes_dir, workers=None, force=False, batch_size=100):
+    """Render the labels that are missing or out of date; return (rendered, cached)."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    todo = []
+    for ksk in dict.fromkeys(ksks):
+        path = os.path.join(out_dir, f"{ksk}.gif")
+        recorded = manifest.get(ksk)
+        if recorded == content_hash(ksk) and os.path.exists(path):
+            continue
+        if recorded is None and os.path.exists(path) and not force:
+            continue  # Hand-made label
+        todo.append(ksk)
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    if len(batches) <= 1 or workers == 1:
+        results = [render_batch(out_dir, batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_batch, [out_dir] * len(batches), batches))
+    for done in results:
+        manifest.update(done)
+    if todo:
+        save_manifest(out_dir, manifest)
+    return len(todo), len(dict.fromkeys(ksks)) - len(todo)
+
+
+def pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_sheet(path, labels, columns=3, rows=8):
+    """
+    Write labels [(KSKNr, caption)] to a multi-page A4 PDF, columns x rows
+    per page, each with the barcode, the KSKNr and the caption (e.g. PMOD).
+    """
+    page_w, page_h, margin = 595.0, 842.0, 28.0
+    cell_w = (page_w - 2 * margin) / columns
+    cell_h = (page_h - 2 * margin) / rows
+    per_page = columns * rows
+
+    pages = []
+    for start in range(0, len(labels), per_page):
+        ops = []
+        for n, (ksk, caption) in enumerate(labels[start:start + per_page]):
+            x0 = margin + (n % columns) * cell_w
+            y0 = page_h - margin - (n // columns + 1) * cell_h
+            modules = code128_modules(ksk)
+            module = min(0.9, (cell_w - 20) / len(modules))
+            bar_x = x0 + (cell_w - module * len(modules)) / 2
+            bar_y, bar_h = y0 + 26, cell_h - 36
+            run_start = None
+            for i, bit in enumerate(modules + "0"):
+                if bit == "1" and run_start is None:
+                    run_start = i
+                elif bit == "0" and run_start is not None:
+                    ops.append(f"{bar_x + run_start * module:.2f} {bar_y:.2f} "
+                               f"{(i - run_start) * module:.2f} {bar_h:.2f} re")
+                    run_start = None
+            ops.append("f")
+            ops.append(f"BT /F1 9 Tf {x0 + 10:.2f} {y0 + 14:.2f} Td ({pdf_escape(ksk)}) Tj ET")
+            if caption:
+                ops.append(f"BT /F1 7 Tf {x0 + 10:.2f} {y0 + 5:.2f} Td ({pdf_escape(caption)}) Tj ET")
+        pages.append("\n".join(ops).encode('latin-1', 'replace'))
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content per page
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for content in pages:
+        page_id, content_id = len(objects) + 1, len(objects) + 2
+        kids.append(f"{page_id} 0 R")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.0f} {page_h:.0f}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+    return len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render KSK barcode labels.")
+    parser.add_argument('source', nargs='?', default='ksk_table.csv', help="ksk_table.csv or ksk_pmod.json")
+    parser.add_argument('--out', default=barcodes_dir)
+    parser.add_argument('--workers', type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument('--sheet', help="Also write a printable multi-page PDF")
+    parser.add_argument('--force', action='store_true', help="Re-render labels not made by this tool")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    catalog = read_catalog(args.source)
+    start = time.perf_counter()
+    rendered, cached = generate([ksk for ksk, _ in catalog], args.out, args.workers, args.force)
+    print(f"{rendered} labels rendered, {cached} up to date, {time.perf_counter() - start:.2f}s.")
+    if args.sheet:
+        pages = write_sheet(args.sheet, catalog)
+        print(f"Wrote {len(catalog)} labels on {pages} pages to '{args.sheet}'.")
+
+
+if __name__ == "__main__":
+    main()
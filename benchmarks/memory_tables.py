@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+memory_tables.py
+
+Memory use of the loaded ksk_pmod table: plain json.load dict-of-dicts
+against the interned representations of compact_tables.py, for
+synthetic catalogs of 10k, 100k and 1M KSKs. Retained is what stays
+allocated after loading, peak includes the parse. Load times are taken
+under tracemalloc, so only compare them with each other.
+
+Usage:
+    python benchmarks/memory_tables.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Import the station modules from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compact_tables import RecordPool, intern_hook, load_ksk_table
+from synthetic import synthetic_catalog
+
+
+def load_dicts(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_interned(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f, object_hook=intern_hook(RecordPool()))
+
+
+def load_compact(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return load_ksk_table(f)
+
+
+VARIANTS = [
+    ("json.load dicts", load_dicts),
+    ("interned records", load_interned),
+    ("compact table", load_compact),
+]
+
+
+def measure(loader, path):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = loader(path)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+    return retained, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory benchmark of the ksk_pmod table representations.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'KSKs':>9}  {'variant':<18} {'retained':>11} {'bytes/KSK':>10} {'peak':>11} {'load':>8}")
+    for size in args.sizes:
+        with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as f:
+            f.write(synthetic_catalog(size))
+        try:
+            for name, loader in VARIANTS:
+                retained, peak, elapsed = measure(loader, f.name)
+                print(f"{size:>9}  {name:<18} {retained / 2**20:>8.1f} MB {retained / size:>10.1f} "
+                      f"{peak / 2**20:>8.1f} MB {elapsed:>7.2f}s")
+        finally:
+            os.remove(f.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+microbench.py
+
+Microbenchmarks for the hot functions of a scan:
+
+    extract_digits     KSKNr extraction from a raw scanner line (read_from_scanner)
+    lookup_payload     table lookup -> compiled steps -> move_command (find_and_send_steps)
+    load_json[-N]      cold load_json_data of an N-KSK catalog
+    reload_json[-N]    load_json_data of an unchanged N-KSK catalog (differential reload)
+    render_request     Krosy data request rendering (create_xml_request)
+    parse_response     Krosy response parsing (parse_data_response, extract_response_id)
+
+Data comes from synthetic.py, sized from the real ksk_pmod.json. Results
+can be saved as a baseline and later runs compared against it. The best
+of the repeats is compared, being the least noisy; a benchmark slower
+than baseline * (1 + threshold) is flagged and the exit status is 1, so
+the suite can guard every optimisation of these paths.
+
+Benchmarks that need main.py are skipped when its dependencies
+(pyserial, tkinter) are not installed.
+
+Usage:
+    python benchmarks/microbench.py --save benchmarks/baseline.json
+    python benchmarks/microbench.py --baseline benchmarks/baseline.json [--threshold 0.15]
+    python benchmarks/microbench.py --filter load --sizes 1000 1000000
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+# Import the station modules from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import (KskDistribution, repo_dir, synthetic_krosy_response, synthetic_ksk_pmod,
+                       synthetic_pmod_settings, synthetic_scan_lines)
+
+from calibration import CalibrationTable
+from compact_tables import CompactKskTable
+from krosy_client import extract_response_id, parse_data_response
+from krosy_messages import KrosyMessageBuilder
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+default_sizes = [1_000, 10_000, 100_000, 1_000_000]
+
+
+class Skip(Exception):
+    """Raised by a benchmark setup that cannot run here."""
+
+
+def import_main():
+    try:
+        import main
+    except ImportError as e:
+        raise Skip(f"main.py not importable: {e}")
+    return main
+
+
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=None):
+    """Register a setup function returning (callable, items per call)."""
+    def register(setup):
+        BENCHMARKS.append((name, setup, repeat))
+        return setup
+    return register
+
+
+@benchmark("extract_digits")
+def bench_extract_digits(ctx):
+    main = import_main()
+    lines = synthetic_scan_lines(ctx["table"], 1000)
+    extract = main.extract_ksk_digits
+
+    def run():
+        for line in lines:
+            extract(line)
+    return run, len(lines)
+
+
+@benchmark("lookup_payload")
+def bench_lookup_payload(ctx):
+    main = import_main()
+    table = CompactKskTable.from_dict(ctx["table"])
+    calibration = ctx["calibration"]
+    keys = [line.strip().decode('latin-1') for line in synthetic_scan_lines(ctx["table"], 1000)]
+    move_command = main.move_command
+
+    def run():
+        for ksk in keys:
+            entry = table.get(ksk)
+            move_command(calibration.steps_for(entry.get("pmod")))
+    return run, len(keys)
+
+
+def headless_app(main, workdir, size, ctx):
+    """A headless SimpleSerialApp reading a synthetic catalog from workdir."""
+    ksk_pmod = synthetic_ksk_pmod(size, ctx["distribution"])
+    ksk_path = os.path.join(workdir, f"ksk_pmod-{size}.json")
+    settings_path = os.path.join(workdir, f"pmod_settings-{size}.json")
+    with open(ksk_path, 'w', encoding='utf-8') as f:
+        json.dump(ksk_pmod, f, indent=4)
+    with open(settings_path, 'w', encoding='utf-8') as f:
+        json.dump(synthetic_pmod_settings(ksk_pmod), f, indent=4)
+
+    main.krosy_enabled = False
+    main.shared_config_enabled = False
+    main.scan_history_path = ':memory:'
+    app = ctx.get("app")
+    if app is None:
+        # No watcher thread: it would reload (and race the catalog rewrites) while timing
+        app = ctx["app"] = main.SimpleSerialApp(None, serial_port=None, scanner_device=None,
+                                                watch_files=False)
+    app.ksk_pmod_path, app.pmod_settings_path = ksk_path, settings_path
+    return app
+
+
+def register_load_benchmarks(sizes):
+    for size in sizes:
+        repeat = 3 if size >= 100_000 else None
+
+        def cold(ctx, size=size):
+            main = import_main()
+            app = headless_app(main, ctx["workdir"], size, ctx)
+
+            def run():
+                app.ksk_pmod, app.pmod_settings = {}, {}
+                app.ksk_pmod_mtime = app.pmod_settings_mtime = None
+                app.load_json_data()
+            return run, 1
+
+        def reload(ctx, size=size):
+            main = import_main()
+            app = headless_app(main, ctx["workdir"], size, ctx)
+            app.ksk_pmod, app.pmod_settings = {}, {}
+            app.ksk_pmod_mtime = app.pmod_settings_mtime = None
+            app.load_json_data()
+
+            def run():
+                app.ksk_pmod_mtime = app.pmod_settings_mtime = None
+                app.load_json_data()
+            return run, 1
+
+        benchmark(f"load_json-{size}", repeat)(cold)
+        benchmark(f"reload_json-{size}", repeat)(reload)
+
+
+@benchmark("render_request")
+def bench_render_request(ctx):
+    builder = KrosyMessageBuilder(ip_address="127.0.0.1", mac_address="00-e0-4c-36-dd-42")
+    keys = list(ctx["table"])[:1000]
+
+    def run():
+        for i, ksk in enumerate(keys):
+            builder.data_request(i, ksk, "2025-01-22T13:52:32")
+    return run, len(keys)
+
+
+@benchmark("create_xml_request")
+def bench_create_xml_request(ctx):
+    # xml-test.py is not a module name; load it by path
+    spec = importlib.util.spec_from_file_location("xml_test", os.path.join(repo_dir, "xml-test.py"))
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        raise Skip(f"xml-test.py not importable: {e}")
+    keys = list(ctx["table"])[:1000]
+
+    def run():
+        for ksk in keys:
+            module.create_xml_request(ksk)
+    return run, len(keys)
+
+
+@benchmark("parse_response")
+def bench_parse_response(ctx):
+    frames = [synthetic_krosy_response(ksk, request_id=i).encode('utf-8')
+              for i, ksk in enumerate(list(ctx["table"])[:200])]
+
+    def run():
+        for frame in frames:
+            extract_response_id(frame)
+            parse_data_response(frame)
+    return run, len(frames)
+
+
+def measure(run, items, repeat):
+    """Median and best seconds per item."""
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    times = [t / (number * items) for t in timer.repeat(repeat, number)]
+    return statistics.median(times), min(times)
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("results", {})
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the scan hot paths.")
+    parser.add_argument('--filter', help="Only run benchmarks whose name contains this")
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help="Catalog sizes for load_json")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='PATH', help="Write the results as a new baseline")
+    parser.add_argument('--baseline', metavar='PATH', default=default_baseline, help="Baseline to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Allowed slowdown (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    # The station modules read their configuration relative to the working directory
+    os.chdir(repo_dir)
+    register_load_benchmarks(args.sizes)
+    distribution = KskDistribution.load()
+    table = synthetic_ksk_pmod(10_000, distribution)
+    calibration = CalibrationTable()
+    calibration.compile(synthetic_pmod_settings(table))
+    baseline = {} if args.save else load_baseline(args.baseline)
+
+    results, regressions = {}, []
+    print(f"{'benchmark':<22} {'median':>10} {'best':>10} {'baseline':>10} {'change':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        ctx = {"distribution": distribution, "table": table, "calibration": calibration, "workdir": workdir}
+        for name, setup, repeat in BENCHMARKS:
+            if args.filter and args.filter not in name:
+                continue
+            try:
+                run, items = setup(ctx)
+            except Skip as e:
+                print(f"{name:<22} skipped: {e}")
+                continue
+            median, best = measure(run, items, repeat or args.repeat)
+            results[name] = {"median": median, "best": best}
+            line = f"{name:<22} {format_time(median):>10} {format_time(best):>10}"
+            previous = baseline.get(name)
+            if previous:
+                change = best / previous["best"] - 1
+                line += f" {format_time(previous['best']):>10} {change:>+7.1%}"
+                if change > args.threshold:
+                    regressions.append(name)
+                    line += "  REGRESSION"
+            print(line)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.node(),
+                "results": results,
+            }, f, indent=4)
+        print(f"Saved {len(results)} results to '{args.save}'.")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
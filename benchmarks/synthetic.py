@@ -0,0 +1,120 @@
+"""
+synthetic.py
+
+Synthetic station data for the benchmarks, shaped like the real
+ksk_pmod.json: PMOD frequencies, lengths of runs of consecutive KSKs on
+the same PMOD, gaps between runs and stripping lengths are sampled from
+the distribution of the file (or from built-in defaults if it is missing).
+"""
+
+import json
+import os
+import random
+from collections import Counter
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ksk_pmod_path = os.path.join(repo_dir, 'ksk_pmod.json')
+
+
+class KskDistribution:
+    """Empirical distribution of a ksk_pmod table."""
+
+    def __init__(self, pmods, runs, gaps, stripping, first_ksk):
+        self.pmods = pmods          # Counter of PMOD -> KSK count
+        self.runs = runs            # list of run lengths
+        self.gaps = gaps            # list of KSK number gaps between runs
+        self.stripping = stripping  # PMOD -> stripping_length
+        self.first_ksk = first_ksk
+
+    @classmethod
+    def from_table(cls, ksk_pmod):
+        pmods, runs, gaps, stripping = Counter(), [], [], {}
+        previous_ksk = previous_pmod = None
+        run = 0
+        for ksk in sorted(ksk_pmod, key=int):
+            entry = ksk_pmod[ksk]
+            pmod = entry.get("pmod")
+            pmods[pmod] += 1
+            stripping.setdefault(pmod, entry.get("stripping_length"))
+            number = int(ksk)
+            if previous_ksk is not None and number == previous_ksk + 1 and pmod == previous_pmod:
+                run += 1
+            else:
+                if run:
+                    runs.append(run)
+                if previous_ksk is not None:
+                    gaps.append(number - previous_ksk - 1)
+                run = 1
+            previous_ksk, previous_pmod = number, pmod
+        if run:
+            runs.append(run)
+        first = min((int(ksk) for ksk in ksk_pmod), default=830569500000)
+        return cls(pmods, runs or [1], gaps or [0], stripping, first)
+
+    @classmethod
+    def load(cls, path=ksk_pmod_path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_table(json.load(f))
+        except (OSError, ValueError):
+            return cls.default()
+
+    @classmethod
+    def default(cls):
+        pmods = Counter({f"P{8378600 + i}": 20 for i in range(19)})
+        return cls(pmods, [5, 10, 20, 40, 60], [0, 0, 1, 5, 20],
+                   {pmod: 93 for pmod in pmods}, 830569500000)
+
+
+def synthetic_ksk_pmod(size, distribution=None, seed=1):
+    """A ksk_pmod dict with size KSKs drawn from distribution."""
+    distribution = distribution or KskDistribution.load()
+    rng = random.Random(seed)
+    names = list(distribution.pmods)
+    weights = [distribution.pmods[name] for name in names]
+    entries = {}
+    ksk = distribution.first_ksk
+    while len(entries) < size:
+        pmod = rng.choices(names, weights)[0]
+        entry = {"pmod": pmod, "stripping_length": distribution.stripping.get(pmod)}
+        for _ in range(min(rng.choice(distribution.runs), size - len(entries))):
+            entries[str(ksk)] = dict(entry)
+            ksk += 1
+        ksk += rng.choice(distribution.gaps)
+    return entries
+
+
+def synthetic_catalog(size, distribution=None, seed=1):
+    """ksk_pmod.json text for size KSKs, formatted like the real file."""
+    return json.dumps(synthetic_ksk_pmod(size, distribution, seed), indent=4)
+
+
+def synthetic_pmod_settings(ksk_pmod, seed=1):
+    """pmod_settings for every PMOD of ksk_pmod."""
+    rng = random.Random(seed)
+    pmods = sorted({entry["pmod"] for entry in ksk_pmod.values()})
+    return {pmod: {"lengthmm": round(rng.uniform(90, 400), 1)} for pmod in pmods}
+
+
+def synthetic_scan_lines(ksk_pmod, count=1000, seed=1):
+    """Raw scanner lines (bytes) for KSKs of the table, as /dev/scan delivers them."""
+    rng = random.Random(seed)
+    keys = list(ksk_pmod)
+    return [f"{rng.choice(keys)}\r\n".encode('latin-1') for _ in range(count)]
+
+
+def synthetic_krosy_response(scancode, ident="P8378691", distance=20, request_id=1):
+    """A type="1" Krosy response like response.xml."""
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><krosy>\n<header>\n<sourcehost>\n'
+        f'<requestid>{request_id}</requestid>\n<hostname>ksskringdistance01</hostname>\n'
+        f'<ip>127.0.0.1</ip>\n<macaddress>00-e0-4c-36-dd-42</macaddress>\n</sourcehost>\n'
+        f'<targethost>\n<responseid>{request_id}</responseid>\n<hostname>ksskringdistance01</hostname>\n'
+        f'</targethost>\n\n</header>\n<body device="ksskringdistance01" ordercount="1">\n'
+        f'<order id="1" type="1" state="1" scancode="{scancode}" timestamp="2025-01-22T13:52:32">\n'
+        f'<response type="1" state="1" amount="1">\n'
+        f'<info projekt="A56M" ksknr="{scancode}" kskindex="3" lfdnr="0">\n'
+        f'<ksident ident="" ben1="_" ben2="_"/></info> \n<objects objectcount="1">\n\n'
+        f'<object id="0" state="0">\n<terminal ident="{ident}" distance="{distance}"></terminal> \n'
+        f'</object> \n\n</objects> \n</response></order></body></krosy> \n'
+    )
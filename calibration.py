@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+"""
+calibration.py
+
+Per-PMOD step calibration. At reload the configuration is compiled into
+a lookup table so a scan only does a dict lookup for its step target.
+
+Sources:
+    pmod_settings.json   PMOD -> lengthmm, and optional "axes": {V: steps} setpoints
+                         of further controller axes (connector, coding, shield terminal)
+    3pass_table.csv      PMOD -> Ident (connector variant)
+    db.json              Ident -> variant, offset, steps/mili
+    hozzarendeles.json   Krosy distance -> output length (per PMOD)
+    calibration.json     Ident -> fitted offset and mm_per_step (written by 'fit'),
+                         or measured [lengthmm, steps] points
+
+Each Ident gets a linear model steps = (lengthmm - offset) / mm_per_step,
+or a piecewise-linear curve through its measured points. Without
+calibration data the station's original constants (81.8 mm, 0.02 mm/step)
+are used, so positions only change when a calibration exists. The
+db.json coefficients are used only if use_db_coefficients is set.
+PMODs without a lengthmm setting get no step target, and the station does
+not move for them. If use_distance_fallback is set, such a scan instead
+moves to the output length hozzarendeles.json maps its Krosy distance to.
+
+Usage:
+    python calibration.py show
+    python calibration.py fit measurements.csv   # columns: ident,steps,measured_mm
+"""
+
+import argparse
+import bisect
+import csv
+import json
+import logging
+import os
+
+from machine_state import MAIN_AXIS
+
+DEFAULT_OFFSET = 81.8       # mm at step 0
+DEFAULT_MM_PER_STEP = 0.02  # mm per controller step
+
+db_path = 'db.json'
+pass_table_path = '3pass_table.csv'
+distance_map_path = 'hozzarendeles.json'
+calibration_path = 'calibration.json'
+
+
+class LinearModel:
+    """steps = (lengthmm - offset) / mm_per_step"""
+
+    __slots__ = ('offset', 'mm_per_step')
+
+    def __init__(self, offset=DEFAULT_OFFSET, mm_per_step=DEFAULT_MM_PER_STEP):
+        self.offset = offset
+        self.mm_per_step = mm_per_step
+
+    def __call__(self, lengthmm):
+        return (lengthmm-self.offset)/self.mm_per_step
+
+    def __repr__(self):
+        return f"LinearModel(offset={self.offset}, mm_per_step={self.mm_per_step})"
+
+
+DEFAULT_MODEL = LinearModel()
+
+
+class PiecewiseLinear:
+    """Interpolates between (x, y) points, extrapolating along the end segments."""
+
+    def __init__(self, points):
+        points = sorted(points)
+        self.xs = [x for x, _ in points]
+        self.ys = [y for _, y in points]
+
+    def __repr__(self):
+        return f"PiecewiseLinear({len(self.xs)} points)"
+
+    def __call__(self, x):
+        xs, ys = self.xs, self.ys
+        if not xs:
+            return None
+        if len(xs) == 1:
+            return ys[0]
+        i = min(max(bisect.bisect_left(xs, x), 1), len(xs) - 1)
+        x0, x1, y0, y1 = xs[i - 1], xs[i], ys[i - 1], ys[i]
+        return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (json.JSONDecodeError, OSError) as e:
+        logging.error(f"Could not read calibration source '{path}': {e}")
+        return default
+
+
+def load_pmod_idents(path=pass_table_path):
+    """Return {PMOD: Ident} from the 3pass table."""
+    idents = {}
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = [column.strip() for column in next(reader, [])]
+            pmod_col, ident_col = header.index('P-mod'), header.index('Ident')
+            for row in reader:
+                if len(row) > max(pmod_col, ident_col) and row[pmod_col].strip():
+                    idents[row[pmod_col].strip()] = row[ident_col].strip()
+    except FileNotFoundError:
+        pass
+    except (ValueError, OSError) as e:
+        logging.error(f"Could not read '{path}': {e}")
+    return idents
+
+
+def parse_axes(pmod, entry):
+    """{axis: steps} from the optional "axes" of a pmod_settings entry."""
+    if not isinstance(entry, dict) or not entry.get("axes"):
+        return {}
+    try:
+        return {str(axis): steps if isinstance(steps, (int, float)) else float(steps)
+                for axis, steps in entry["axes"].items()}
+    except (AttributeError, TypeError, ValueError):
+        logging.error(f"Invalid axes setting for PMOD {pmod}: {entry['axes']!r}")
+        return {}
+
+
+class CalibrationTable:
+    """Compiled PMOD -> steps lookup, rebuilt whenever the configuration reloads."""
+
+    def __init__(self, use_db_coefficients=False, use_distance_fallback=False):
+        self.use_db_coefficients = use_db_coefficients
+        self.use_distance_fallback = use_distance_fallback
+        self.models = {}           # Ident -> LinearModel or PiecewiseLinear
+        self.pmod_idents = {}      # PMOD -> Ident
+        self.output_by_distance = {}  # Krosy distance -> output length in mm
+        self.steps_by_pmod = {}    # PMOD -> precomputed steps
+        self.lengthmm_by_pmod = {}
+        self.axes_by_pmod = {}     # PMOD -> {axis: steps} of further axes
+        self.reload_sources()
+
+    def reload_sources(self):
+        """Re-read the calibration sources that change rarely."""
+        self.pmod_idents = load_pmod_idents()
+        output_by_distance = {}
+        for pmod, entry in load_json(distance_map_path, {}).items():
+            try:
+                output_by_distance[float(entry["distance"])] = float(entry["output"])
+            except (KeyError, TypeError, ValueError):
+                logging.error(f"Invalid distance mapping for PMOD {pmod} in '{distance_map_path}'.")
+        self.output_by_distance = output_by_distance
+
+        models = {}
+        if self.use_db_coefficients:
+            for entry in load_json(db_path, []):
+                try:
+                    # db.json stores the length offset and steps per mm
+                    models[str(entry["Ident"])] = LinearModel(-float(entry["offset"]), 1 / float(entry["steps/mili"]))
+                except (KeyError, TypeError, ValueError, ZeroDivisionError):
+                    continue
+        for ident, entry in load_json(calibration_path, {}).items():
+            try:
+                if entry.get("points"):
+                    models[str(ident)] = PiecewiseLinear(
+                        [(float(length), float(steps)) for length, steps in entry["points"]]
+                    )
+                else:
+                    models[str(ident)] = LinearModel(float(entry["offset"]), float(entry["mm_per_step"]))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                logging.error(f"Invalid calibration entry for Ident {ident} in '{calibration_path}'.")
+        self.models = models
+
+    def model_for(self, pmod):
+        return self.models.get(self.pmod_idents.get(pmod), DEFAULT_MODEL)
+
+    def compile(self, pmod_settings):
+        """Precompute the step target of every PMOD."""
+        lengths = {}
+        for pmod, entry in pmod_settings.items():
+            if isinstance(entry, dict):
+                lengths[pmod] = entry.get("lengthmm", 1)  # Default to 1 if not specified
+        self.lengthmm_by_pmod = lengths
+        self.steps_by_pmod = {pmod: self.model_for(pmod)(lengthmm) for pmod, lengthmm in lengths.items()}
+        self.axes_by_pmod = {pmod: axes for pmod, axes in
+                             ((pmod, parse_axes(pmod, entry)) for pmod, entry in pmod_settings.items()) if axes}
+        logging.info(f"Compiled calibration for {len(self.steps_by_pmod)} PMODs ({len(self.models)} fitted models).")
+
+    def update(self, pmod_settings, pmods):
+        """Recompute the step targets of the given PMODs only."""
+        for pmod in pmods:
+            entry = pmod_settings.get(pmod)
+            axes = parse_axes(pmod, entry)
+            if axes:
+                self.axes_by_pmod[pmod] = axes
+            else:
+                self.axes_by_pmod.pop(pmod, None)
+            if isinstance(entry, dict):
+                lengthmm = entry.get("lengthmm", 1)  # Default to 1 if not specified
+            else:
+                self.lengthmm_by_pmod.pop(pmod, None)
+                self.steps_by_pmod.pop(pmod, None)
+                continue
+            self.lengthmm_by_pmod[pmod] = lengthmm
+            self.steps_by_pmod[pmod] = self.model_for(pmod)(lengthmm)
+
+    def steps_for(self, pmod):
+        """Precomputed step target of a PMOD, or None."""
+        return self.steps_by_pmod.get(pmod)
+
+    def setpoints_for(self, pmod, main_axis=MAIN_AXIS):
+        """All axis setpoints of a PMOD, {axis: steps}; the main axis gets the step target."""
+        setpoints = dict(self.axes_by_pmod.get(pmod, ()))
+        steps = self.steps_by_pmod.get(pmod)
+        if steps is not None:
+            setpoints[main_axis] = steps
+        return setpoints
+
+    def steps_for_length(self, pmod, lengthmm):
+        """Step target for an arbitrary length on a PMOD's model."""
+        return self.model_for(pmod)(lengthmm)
+
+    def distance_fallback(self, pmod, distance):
+        """
+        (lengthmm, steps) for a PMOD without a lengthmm setting, from the output
+        length of the Krosy distance in hozzarendeles.json. None if the
+        fallback is disabled or the distance is not mapped.
+        """
+        if not self.use_distance_fallback:
+            return None
+        try:
+            lengthmm = self.output_by_distance.get(float(distance))
+        except (TypeError, ValueError):
+            return None
+        if lengthmm is None:
+            return None
+        return lengthmm, self.steps_for_length(pmod, lengthmm)
+
+    def lengthmm_for(self, pmod):
+        """Length the step target of a PMOD was computed from, or None."""
+        return self.lengthmm_by_pmod.get(pmod)
+
+
+def fit(rows):
+    """
+    Least-squares fit of measured_mm = offset + mm_per_step * steps per Ident.
+    rows: iterable of (ident, steps, measured_mm). Returns {Ident: coefficients}.
+    All groups are solved at once with numpy.
+    """
+    import numpy as np
+
+    rows = list(rows)
+    if not rows:
+        return {}
+    idents = np.array([str(r[0]) for r in rows])
+    x = np.array([float(r[1]) for r in rows])
+    y = np.array([float(r[2]) for r in rows])
+
+    keys, group = np.unique(idents, return_inverse=True)
+    n = np.bincount(group).astype(float)
+    sx, sy = np.bincount(group, x), np.bincount(group, y)
+    sxx, sxy = np.bincount(group, x * x), np.bincount(group, x * y)
+
+    denom = n * sxx - sx * sx
+    valid = (n >= 2) & (np.abs(denom) > 1e-12)
+    slope = np.where(valid, (n * sxy - sx * sy) / np.where(valid, denom, 1.0), np.nan)
+    intercept = np.where(valid, (sy - slope * sx) / n, np.nan)
+    residual = y - (intercept[group] + slope[group] * x)
+    rmse = np.sqrt(np.bincount(group, residual * residual) / n)
+
+    result = {}
+    for i, ident in enumerate(keys):
+        if not valid[i]:
+            logging.warning(f"Not enough distinct measurements to fit Ident {ident}.")
+            continue
+        result[str(ident)] = {
+            "offset": round(float(intercept[i]), 4),
+            "mm_per_step": round(float(slope[i]), 8),
+            "samples": int(n[i]),
+            "rmse_mm": round(float(rmse[i]), 4),
+        }
+    return result
+
+
+def read_measurements(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield row["ident"].strip(), row["steps"], row["measured_mm"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step calibration tables.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('show', help="Print the compiled PMOD -> steps table")
+    fit_parser = sub.add_parser('fit', help="Fit coefficients from measurements")
+    fit_parser.add_argument('measurements', help="CSV with ident,steps,measured_mm")
+    fit_parser.add_argument('--output', default=calibration_path)
+    parser.add_argument('--use-db', action='store_true', help="Apply db.json coefficients")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    if args.command == 'fit':
+        coefficients = fit(read_measurements(args.measurements))
+        existing = load_json(args.output, {}) if os.path.exists(args.output) else {}
+        existing.update(coefficients)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(existing, f, indent=4)
+        for ident, entry in coefficients.items():
+            print(f"{ident}: offset={entry['offset']} mm_per_step={entry['mm_per_step']} "
+                  f"n={entry['samples']} rmse={entry['rmse_mm']} mm")
+        print(f"Wrote {len(coefficients)} fitted models to '{args.output}'.")
+        return
+
+    table = CalibrationTable(use_db_coefficients=args.use_db)
+    table.compile(load_json('pmod_settings.json', {}))
+    for pmod in sorted(table.steps_by_pmod):
+        print(f"{pmod:<10} {table.pmod_idents.get(pmod, '-'):<8} "
+              f"{table.lengthmm_by_pmod[pmod]:>7} mm  {table.steps_by_pmod[pmod]:>10.1f} steps  "
+              f"{table.model_for(pmod)}")
+
+
+if __name__ == "__main__":
+    main()
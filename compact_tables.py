@@ -0,0 +1,206 @@
+"""
+compact_tables.py
+
+Compact in-memory form of the ksk_pmod table.
+
+json.load gives every KSK its own dict with its own copy of the PMOD
+string, several hundred bytes per harness. Here the distinct
+(pmod, stripping_length) pairs are stored once as interned KskRecord
+objects. The KSK numbers go into a sorted array of 64-bit integers,
+and a parallel array holds the small integer index of each KSK's
+record, about 10 bytes per harness. Lookups are a binary search.
+
+KskRecord supports .get() and [] like the original dicts, so callers
+that use entry.get("pmod") do not change.
+"""
+
+import bisect
+import json
+import sys
+from array import array
+
+
+def is_packable(ksk):
+    """True if ksk is a canonical decimal number that fits the 64-bit key array."""
+    return (isinstance(ksk, str) and ksk.isascii() and ksk.isdigit()
+            and (ksk == "0" or ksk[0] != "0") and len(ksk) < 20)
+
+
+class KskRecord:
+    """One distinct PMOD entry, shared by every KSK that uses it."""
+
+    __slots__ = ('pmod', 'stripping_length')
+
+    def __init__(self, pmod, stripping_length=None):
+        self.pmod = sys.intern(pmod) if isinstance(pmod, str) else pmod
+        self.stripping_length = stripping_length
+
+    def get(self, key, default=None):
+        if key in KskRecord.__slots__:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in KskRecord.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if isinstance(other, KskRecord):
+            return self.pmod == other.pmod and self.stripping_length == other.stripping_length
+        if isinstance(other, dict):
+            return other == self.to_dict()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.pmod, self.stripping_length))
+
+    def to_dict(self):
+        return {"pmod": self.pmod, "stripping_length": self.stripping_length}
+
+    def __repr__(self):
+        return f"KskRecord(pmod={self.pmod!r}, stripping_length={self.stripping_length!r})"
+
+
+class RecordPool:
+    """Interns KskRecords so equal entries share one object and one small index."""
+
+    def __init__(self):
+        self.records = []
+        self._index = {}
+
+    def intern(self, entry):
+        """Return the index of the record equal to entry (a dict or KskRecord)."""
+        key = (entry.get("pmod"), entry.get("stripping_length"))
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.records)
+            self.records.append(KskRecord(*key))
+            self._index[key] = index
+        return index
+
+    def record(self, entry):
+        return self.records[self.intern(entry)]
+
+
+class CompactKskTable:
+    """Read-only KSKNr -> KskRecord table with the dict.get contract."""
+
+    def __init__(self, keys, refs, pool, extra=None):
+        self.keys = keys        # array('Q'), sorted KSK numbers
+        self.refs = refs        # array of record indexes, parallel to keys
+        self.pool = pool        # RecordPool the indexes refer to
+        self.extra = extra or {}  # keys that do not round-trip through int (e.g. leading zeros)
+
+    @property
+    def records(self):
+        return self.pool.records
+
+    @classmethod
+    def from_dict(cls, raw, pool=None):
+        """Build from a parsed ksk_pmod dict (values are dicts or KskRecords)."""
+        pool = pool or RecordPool()
+        keys = array('Q')
+        refs = array('I')
+        extra = {}
+        for ksk, entry in raw.items():
+            if not isinstance(entry, (dict, KskRecord)):
+                continue
+            index = pool.intern(entry)
+            if is_packable(ksk):
+                keys.append(int(ksk))
+                refs.append(index)
+            else:
+                extra[ksk] = pool.records[index]
+        if any(keys[i] >= keys[i + 1] for i in range(len(keys) - 1)):
+            # ksk_pmod.json is normally written in KSK order; sort only when it is not
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            keys = array('Q', (keys[i] for i in order))
+            refs = array('I', (refs[i] for i in order))
+        if len(pool.records) <= 0xFFFF:
+            refs = array('H', refs)
+        return cls(keys, refs, pool, extra)
+
+    def __len__(self):
+        return len(self.keys) + len(self.extra)
+
+    def get(self, ksk, default=None):
+        if not is_packable(ksk):
+            return self.extra.get(ksk, default)
+        ksk_nr = int(ksk)
+        i = bisect.bisect_left(self.keys, ksk_nr)
+        if i < len(self.keys) and self.keys[i] == ksk_nr:
+            return self.records[self.refs[i]]
+        return default
+
+    def __contains__(self, ksk):
+        return self.get(ksk) is not None
+
+    def __getitem__(self, ksk):
+        record = self.get(ksk)
+        if record is None:
+            raise KeyError(ksk)
+        return record
+
+    def items(self):
+        for ksk, ref in zip(self.keys, self.refs):
+            yield str(ksk), self.records[ref]
+        yield from self.extra.items()
+
+    def merged(self, diff):
+        """
+        Return a new table with a config_diff.TableDiff applied; self is not
+        changed, so the result can be swapped in under a lock. Built in one
+        pass: the unchanged runs between changed keys are copied as array
+        slices, so it costs a copy of the arrays plus O(changes log table).
+        """
+        changes = {}  # KSK number -> record index, None to remove
+        extra = dict(self.extra)
+        for ksk in diff.removed:
+            if is_packable(ksk):
+                changes[int(ksk)] = None
+            else:
+                extra.pop(ksk, None)
+        changed = list(diff.added.items()) + [(ksk, new) for ksk, (_, new) in diff.modified.items()]
+        for ksk, entry in changed:
+            index = self.pool.intern(entry)
+            if is_packable(ksk):
+                changes[int(ksk)] = index
+            else:
+                extra[ksk] = self.records[index]
+
+        old_keys, old_refs = self.keys, self.refs
+        if len(self.pool.records) > 0xFFFF and old_refs.typecode == 'H':
+            old_refs = array('I', old_refs)
+        keys, refs = array('Q'), array(old_refs.typecode)
+        start = 0
+        for ksk_nr in sorted(changes):
+            i = bisect.bisect_left(old_keys, ksk_nr, start)
+            keys.extend(old_keys[start:i])
+            refs.extend(old_refs[start:i])
+            # Skip the old entry of a removed or modified key
+            start = i + 1 if i < len(old_keys) and old_keys[i] == ksk_nr else i
+            if changes[ksk_nr] is not None:
+                keys.append(ksk_nr)
+                refs.append(changes[ksk_nr])
+        keys.extend(old_keys[start:])
+        refs.extend(old_refs[start:])
+        return CompactKskTable(keys, refs, self.pool, extra)
+
+
+def intern_hook(pool):
+    """json object_hook that turns KSK entries into shared records while parsing."""
+    def hook(obj):
+        if "pmod" in obj:
+            return pool.record(obj)
+        return obj
+    return hook
+
+
+def load_ksk_table(f, pool=None):
+    """
+    Parse a ksk_pmod.json file object straight into a CompactKskTable.
+    Pass the pool of the previous table so unchanged entries keep their indexes.
+    """
+    pool = pool or RecordPool()
+    return CompactKskTable.from_dict(json.load(f, object_hook=intern_hook(pool)), pool)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+"""
+config_daemon.py
+
+Publishes the station configuration to shared memory so several station
+processes (main.py, mentes.py) on one PC share one compiled copy.
+
+The daemon watches ksk_pmod.json and pmod_settings.json, compiles them
+once per change and publishes the result into a double-buffered shared
+memory segment with a generation counter. Stations attach read-only,
+look KSK numbers up directly in the shared segment (binary search over
+fixed-width records, nothing copied per process) and pick up a new
+generation atomically, so all stations switch configuration together.
+
+The daemon stamps a heartbeat into the header every second. A reader
+treats a segment whose heartbeat is older than stale_after seconds like
+a closed one, so stations fall back to the JSON files when the daemon
+crashes or is killed. A restarted daemon marks a stale segment closed
+before replacing it.
+
+Segment layout:
+    header   magic, capacity, generation, active slot, slot lengths, heartbeat
+    slot 0   compiled configuration
+    slot 1   compiled configuration (the one not being read is rewritten)
+
+Compiled configuration:
+    counts   number of KSK records, number of PMODs, PMOD block length
+    PMOD     JSON {"pmods": [names], "settings": pmod_settings}
+    KSK      sorted records (KSKNr u64, PMOD index u16, stripping length f32)
+
+Usage:
+    python config_daemon.py [--name hv_station_config] [--capacity 16]
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import math
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+shared_config_name = 'hv_station_config'
+
+MAGIC = b'HVCF'
+HEADER = struct.Struct('<4sIQQIxxxxQQd')  # magic, version, capacity, generation, active, len0, len1, heartbeat
+HEADER_SIZE = 64
+# Header fields the publisher writes on their own, at their offsets in HEADER
+GENERATION = struct.Struct('<Q')
+GENERATION_OFFSET = 16
+ACTIVE = struct.Struct('<I')
+ACTIVE_OFFSET = 24
+LENGTH = struct.Struct('<Q')
+LENGTHS_OFFSET = 32
+# time.monotonic() of the daemon's last beat; CLOCK_MONOTONIC is shared by all processes on the host
+HEARTBEAT = struct.Struct('<d')
+HEARTBEAT_OFFSET = 48
+HEARTBEAT_INTERVAL = 1.0
+STALE_AFTER = 5.0
+VERSION = 2
+COUNTS = struct.Struct('<III')
+RECORD = struct.Struct('<QHxxf')
+CLOSED_MAGIC = b'HVCX'
+NO_PMOD = 0xFFFF
+
+
+class SharedConfigClosed(Exception):
+    """The daemon has shut down or stopped beating; its last generation will not change any more."""
+
+
+def heartbeat_age(buf):
+    return time.monotonic() - HEARTBEAT.unpack_from(buf, HEARTBEAT_OFFSET)[0]
+
+
+def compile_config(ksk_pmod, pmod_settings):
+    """Compile the two JSON tables into the binary slot format."""
+    pmods = sorted({entry.get("pmod") for entry in ksk_pmod.values()
+                    if isinstance(entry, dict) and entry.get("pmod")} | set(pmod_settings))
+    if len(pmods) >= NO_PMOD:
+        raise ValueError(f"Too many PMODs for the shared format: {len(pmods)}")
+    pmod_index = {pmod: i for i, pmod in enumerate(pmods)}
+
+    records = []
+    for ksk, entry in ksk_pmod.items():
+        try:
+            ksk_nr = int(ksk)
+        except ValueError:
+            ksk_nr = None
+        if ksk_nr is None or str(ksk_nr) != ksk:
+            logging.warning(f"Skipping non-canonical KSKNr '{ksk}' in shared config.")
+            continue
+        pmod = entry.get("pmod") if isinstance(entry, dict) else None
+        stripping = entry.get("stripping_length") if isinstance(entry, dict) else None
+        try:
+            stripping = float(stripping) if stripping is not None else math.nan
+        except (TypeError, ValueError):
+            stripping = math.nan
+        records.append((ksk_nr, pmod_index.get(pmod, NO_PMOD), stripping))
+    records.sort()
+
+    pmod_block = json.dumps({"pmods": pmods, "settings": pmod_settings},
+                            separators=(',', ':')).encode('utf-8')
+    parts = [COUNTS.pack(len(records), len(pmods), len(pmod_block)), pmod_block]
+    parts.extend(RECORD.pack(*record) for record in records)
+    return b"".join(parts)
+
+
+class SharedConfigPublisher:
+    """Owns the shared segment and publishes new generations into it."""
+
+    def __init__(self, name=shared_config_name, capacity=16 * 1024 * 1024):
+        self.name = name
+        self.capacity = capacity
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + 2 * capacity)
+        except FileExistsError:
+            # Left over from a daemon that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            # Stations still attached to it must fall back instead of serving it forever
+            stale.buf[0:4] = CLOSED_MAGIC
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + 2 * capacity)
+        self.generation = 0
+        self.active = 0
+        self.lengths = [0, 0]
+        self._write_header()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    def _write_header(self):
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, self.capacity, self.generation,
+                         self.active, *self.lengths, time.monotonic())
+
+    def _beat(self):
+        # A thread, so a long compile of a large catalog does not look like a dead daemon
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            HEARTBEAT.pack_into(self.shm.buf, HEARTBEAT_OFFSET, time.monotonic())
+
+    def publish(self, blob):
+        """Write blob into the inactive slot and make it current."""
+        if len(blob) > self.capacity:
+            raise ValueError(f"Compiled config ({len(blob)} bytes) exceeds slot capacity ({self.capacity}).")
+        target = 1 - self.active
+        # Odd generation: readers retry until the switch is complete
+        self._write_generation(self.generation + 1)
+        start = HEADER_SIZE + target * self.capacity
+        self.shm.buf[start:start + len(blob)] = blob
+        self.lengths[target] = len(blob)
+        LENGTH.pack_into(self.shm.buf, LENGTHS_OFFSET + target * LENGTH.size, len(blob))
+        self.active = target
+        ACTIVE.pack_into(self.shm.buf, ACTIVE_OFFSET, target)
+        # The even generation goes last, on its own, so a reader that sees it
+        # also sees the slot it belongs to
+        self._write_generation(self.generation + 1)
+        return self.generation
+
+    def _write_generation(self, generation):
+        self.generation = generation
+        GENERATION.pack_into(self.shm.buf, GENERATION_OFFSET, generation)
+
+    def close(self):
+        self._stop.set()
+        self._heartbeat.join()
+        # Tell attached stations to fall back to the files before the name goes away
+        self.shm.buf[0:4] = CLOSED_MAGIC
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedKskTable:
+    """Read-only KSKNr lookups directly in one published slot."""
+
+    def __init__(self, reader, generation, pmods, count, records_start):
+        self.reader = reader
+        self.generation = generation
+        self.buf = reader.shm.buf
+        self.pmods = pmods
+        self.count = count
+        self.records_start = records_start
+        self._keys = _RecordKeys(self.buf, records_start, count)
+
+    def __len__(self):
+        return self.count
+
+    def get(self, ksk, default=None):
+        """Same contract as dict.get on the ksk_pmod table."""
+        try:
+            ksk_nr = int(ksk)
+        except (TypeError, ValueError):
+            return default
+        if str(ksk_nr) != ksk:
+            return default
+        i = bisect.bisect_left(self._keys, ksk_nr)
+        if i < self.count and self._keys[i] == ksk_nr:
+            _, pmod_idx, stripping = RECORD.unpack_from(self.buf, self.records_start + i * RECORD.size)
+        else:
+            pmod_idx = None
+        if self.reader.current_generation() > self.generation + 2:
+            # Our slot has been rewritten since this snapshot; read the current one
+            _, table, _ = self.reader.read()
+            return table.get(ksk, default)
+        if pmod_idx is None:
+            return default
+        if math.isnan(stripping):
+            stripping = None
+        elif stripping.is_integer():
+            stripping = int(stripping)
+        return {
+            "pmod": self.pmods[pmod_idx] if pmod_idx != NO_PMOD else None,
+            "stripping_length": stripping,
+        }
+
+    def __contains__(self, ksk):
+        return self.get(ksk) is not None
+
+
+class _RecordKeys:
+    """Sequence view of the KSKNr column, for bisect."""
+
+    __slots__ = ('buf', 'start', 'count')
+
+    def __init__(self, buf, start, count):
+        self.buf = buf
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return struct.unpack_from('<Q', self.buf, self.start + i * RECORD.size)[0]
+
+
+class SharedConfigReader:
+    """Attaches to the daemon's segment and hands out consistent snapshots."""
+
+    def __init__(self, name=shared_config_name, stale_after=STALE_AFTER):
+        self.stale_after = stale_after
+        self.shm = shared_memory.SharedMemory(name)
+        try:
+            # Attaching must not make this process unlink the segment at exit (Python < 3.13)
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        except Exception:
+            pass
+        magic, version = struct.unpack_from('<4sI', self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError(f"Shared memory '{name}' is not a station config segment.")
+        self.generation = None
+        try:
+            self.check_alive()
+        except SharedConfigClosed:
+            self.shm.close()
+            raise
+
+    def check_alive(self):
+        """Raise SharedConfigClosed if the daemon closed the segment or stopped beating."""
+        if self.shm.buf[0:4] != MAGIC:
+            raise SharedConfigClosed(f"Shared config segment '{self.shm.name}' was closed.")
+        age = heartbeat_age(self.shm.buf)
+        if age > self.stale_after:
+            raise SharedConfigClosed(f"Shared config daemon of '{self.shm.name}' has not beaten for {age:.0f}s.")
+
+    def current_generation(self):
+        return GENERATION.unpack_from(self.shm.buf, GENERATION_OFFSET)[0]
+
+    def read(self, timeout=1.0):
+        """
+        Return (generation, SharedKskTable, pmod_settings) of the current generation.
+        Raises SharedConfigClosed once the daemon has exited or its heartbeat is
+        stale, TimeoutError if no
+        complete generation could be read within timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.check_alive()
+            capacity = HEADER.unpack_from(self.shm.buf, 0)[2]
+            # The generation is read before the active slot, the reverse of the publish order
+            generation = self.current_generation()
+            # Odd: a publish is in progress. Zero: nothing published yet.
+            if generation and generation % 2 == 0:
+                active = ACTIVE.unpack_from(self.shm.buf, ACTIVE_OFFSET)[0]
+                start = HEADER_SIZE + active * capacity
+                n_ksk, _, pmod_len = COUNTS.unpack_from(self.shm.buf, start)
+                block_start = start + COUNTS.size
+                pmod_block = bytes(self.shm.buf[block_start:block_start + pmod_len])
+                # Unchanged generation: the slot was not rewritten while we copied it
+                if self.current_generation() == generation:
+                    pmod_block = json.loads(pmod_block)
+                    table = SharedKskTable(self, generation, pmod_block["pmods"], n_ksk, block_start + pmod_len)
+                    return generation, table, pmod_block["settings"]
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No complete generation in shared config '{self.shm.name}'.")
+            time.sleep(0.001)
+
+    def poll(self, timeout=1.0):
+        """
+        Like read(), but return None unless a newer generation was published.
+        generation stays None until the daemon has published its first one.
+        """
+        self.check_alive()
+        generation = self.current_generation()
+        if generation == self.generation or generation == 0:
+            return None
+        snapshot = self.read(timeout)
+        self.generation = snapshot[0]
+        return snapshot
+
+    def close(self):
+        self.shm.close()
+
+
+def load_tables(ksk_pmod_path, pmod_settings_path):
+    with open(ksk_pmod_path, 'r', encoding='utf-8') as f:
+        ksk_pmod = json.load(f)
+    with open(pmod_settings_path, 'r', encoding='utf-8') as f:
+        pmod_settings = json.load(f)
+    return ksk_pmod, pmod_settings
+
+
+def run_daemon(name, capacity, ksk_pmod_path, pmod_settings_path, interval=1.0):
+    publisher = SharedConfigPublisher(name, capacity)
+    logging.info(f"Publishing station config to shared memory '{name}'.")
+    mtimes = None
+    try:
+        while True:
+            try:
+                current = (os.path.getmtime(ksk_pmod_path), os.path.getmtime(pmod_settings_path))
+                if current != mtimes:
+                    ksk_pmod, pmod_settings = load_tables(ksk_pmod_path, pmod_settings_path)
+                    blob = compile_config(ksk_pmod, pmod_settings)
+                    generation = publisher.publish(blob)
+                    mtimes = current
+                    logging.info(f"Published generation {generation}: {len(ksk_pmod)} KSKs, "
+                                 f"{len(pmod_settings)} PMOD settings, {len(blob)} bytes.")
+            except (OSError, ValueError) as e:
+                # Keep serving the last good generation (JSONDecodeError is a ValueError)
+                logging.error(f"Could not publish station config: {e}")
+            time.sleep(interval)
+    finally:
+        publisher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-memory station config daemon.")
+    parser.add_argument('--name', default=shared_config_name)
+    parser.add_argument('--capacity', type=float, default=16, help="Slot capacity in MB")
+    parser.add_argument('--ksk-pmod', default='ksk_pmod.json')
+    parser.add_argument('--pmod-settings', default='pmod_settings.json')
+    parser.add_argument('--interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    # systemd stops the daemon with SIGTERM; unwind so the segment is closed and unlinked
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        run_daemon(args.name, int(args.capacity * 1024 * 1024), args.ksk_pmod, args.pmod_settings, args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
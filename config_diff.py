@@ -0,0 +1,134 @@
+"""
+config_diff.py
+
+Differential reload of the lookup tables. When a JSON file changes, the
+old and new parsed tables are diffed by key, only the added, removed and
+modified entries are applied to the live table (a CompactKskTable is
+rebuilt in one pass and swapped), and only the caches of the affected
+keys are invalidated. Every reload logs one compact change record, e.g.
+
+    pmod_settings.json: +0 -0 ~1 (P8378690 lengthmm 200 -> 210)
+"""
+
+from compact_tables import CompactKskTable
+
+
+class TableDiff:
+    """Entries added, removed and modified between two versions of a table."""
+
+    def __init__(self, added=None, removed=None, modified=None):
+        self.added = added or {}        # key -> new entry
+        self.removed = removed or {}    # key -> old entry
+        self.modified = modified or {}  # key -> (old entry, new entry)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def update(self, other):
+        self.added.update(other.added)
+        self.removed.update(other.removed)
+        self.modified.update(other.modified)
+
+    def keys(self):
+        """All keys whose entry changed."""
+        return set(self.added) | set(self.removed) | set(self.modified)
+
+    def record(self, name, details=5):
+        """One-line change record for the log."""
+        parts = []
+        for key in list(self.added)[:details]:
+            parts.append(f"+{key}")
+        for key in list(self.removed)[:details]:
+            parts.append(f"-{key}")
+        for key, (old, new) in list(self.modified.items())[:details]:
+            parts.append(f"{key} {describe_change(old, new)}")
+        shown = ", ".join(parts)
+        if len(self.added) > details or len(self.removed) > details or len(self.modified) > details:
+            shown += ", ..."
+        summary = f"{name}: +{len(self.added)} -{len(self.removed)} ~{len(self.modified)}"
+        return f"{summary} ({shown})" if shown else summary
+
+
+def as_dict(entry):
+    if entry is None or isinstance(entry, dict):
+        return entry
+    return entry.to_dict()
+
+
+def describe_change(old, new):
+    """'field old -> new' for every field that differs between two entries."""
+    old, new = as_dict(old), as_dict(new)
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return f"{old!r} -> {new!r}"
+    return " ".join(f"{field} {old.get(field)} -> {new.get(field)}"
+                    for field in sorted(set(old) | set(new), key=str)
+                    if old.get(field) != new.get(field))
+
+
+def diff_tables(old, new):
+    """Diff two tables with items() and get() (dicts or CompactKskTables)."""
+    if isinstance(old, CompactKskTable) and isinstance(new, CompactKskTable):
+        return diff_compact(old, new)
+    diff = TableDiff()
+    for key, entry in new.items():
+        previous = old.get(key)
+        if previous is None:
+            diff.added[key] = entry
+        elif previous != entry:
+            diff.modified[key] = (previous, entry)
+    for key, entry in old.items():
+        if new.get(key) is None:
+            diff.removed[key] = entry
+    return diff
+
+
+def diff_compact(old, new):
+    """
+    Fast diff of two CompactKskTables. If new was loaded with old's record
+    pool, equal entries have equal record indexes and an unchanged catalog
+    is recognised by comparing the arrays.
+    """
+    if new.pool is not old.pool:
+        return diff_tables(dict(old.items()), dict(new.items()))
+    if old.keys == new.keys:
+        diff = TableDiff()
+        if old.refs != new.refs:
+            for i, (old_ref, new_ref) in enumerate(zip(old.refs, new.refs)):
+                if old_ref != new_ref:
+                    diff.modified[str(old.keys[i])] = (old.records[old_ref], new.records[new_ref])
+        diff.update(diff_tables(old.extra, new.extra))
+        return diff
+    # Keys were added or removed: merge the two sorted key arrays
+    diff = TableDiff()
+    i = j = 0
+    old_keys, new_keys = old.keys, new.keys
+    while i < len(old_keys) or j < len(new_keys):
+        if j == len(new_keys) or (i < len(old_keys) and old_keys[i] < new_keys[j]):
+            diff.removed[str(old_keys[i])] = old.records[old.refs[i]]
+            i += 1
+        elif i == len(old_keys) or new_keys[j] < old_keys[i]:
+            diff.added[str(new_keys[j])] = new.records[new.refs[j]]
+            j += 1
+        else:
+            if old.refs[i] != new.refs[j]:
+                diff.modified[str(old_keys[i])] = (old.records[old.refs[i]], new.records[new.refs[j]])
+            i += 1
+            j += 1
+    diff.update(diff_tables(old.extra, new.extra))
+    return diff
+
+
+def apply_diff(table, diff):
+    """
+    Apply diff to table and return the result: a dict is changed in place,
+    a CompactKskTable is left unchanged and a merged copy returned.
+    """
+    if isinstance(table, CompactKskTable):
+        return table.merged(diff)
+    for key in diff.removed:
+        table.pop(key, None)
+    for key, entry in diff.added.items():
+        table[key] = entry
+    for key, (_, entry) in diff.modified.items():
+        table[key] = entry
+    return table
@@ -0,0 +1,190 @@
+"""
+diagnostics.py
+
+On-demand diagnostics for a running station (POSIX signals):
+
+    kill -USR1 <pid>    dump the stacks of all threads to diagnostics/stacks.log
+    kill -USR2 <pid>    start/stop the sampling profiler; on stop the samples
+                        are written to diagnostics/profile-<time>.collapsed
+                        (collapsed-stack format, e.g. for flamegraph.pl)
+
+The stack dump uses faulthandler, so it works even when the main (Tk)
+thread is stuck in C code. The optional watchdog logs whenever a tracked
+section, such as the scan handler, or the Tk event loop is blocked for
+longer than a threshold, together with the blocked thread's stack.
+"""
+
+import faulthandler
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+diagnostics_dir = 'diagnostics'
+
+
+def thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def format_stack(frame, limit=None):
+    return "".join(traceback.format_stack(frame, limit))
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.samples = Counter()
+        self._stop.clear()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logging.info(f"Sampling profiler started ({self.interval * 1000:.0f} ms interval).")
+
+    def stop(self, path=None):
+        """Stop sampling and write the collapsed stacks; return the output path."""
+        if not self.running:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if path is None:
+            os.makedirs(diagnostics_dir, exist_ok=True)
+            stamp = datetime.fromtimestamp(self.started).strftime('%Y%m%d-%H%M%S')
+            path = os.path.join(diagnostics_dir, f"profile-{stamp}.collapsed")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logging.info(f"Sampling profiler stopped, {sum(self.samples.values())} samples written to '{path}'.")
+        return path
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class Watchdog:
+    """Logs sections and event loops that stay blocked longer than a threshold."""
+
+    def __init__(self, threshold=1.0, interval=0.25):
+        self.threshold = threshold
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}     # section name -> (thread ident, start time)
+        self._beats = {}      # loop name -> (thread ident, last beat)
+        self._reported = set()
+        self._thread = None
+
+    @contextmanager
+    def track(self, name):
+        """Mark a section whose run time is watched."""
+        with self._lock:
+            self._active[name] = (threading.get_ident(), time.monotonic())
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.pop(name, None)
+                self._reported.discard(name)
+
+    def beat(self, name):
+        """Record that an event loop is alive."""
+        with self._lock:
+            self._beats[name] = (threading.get_ident(), time.monotonic())
+            self._reported.discard(name)
+
+    def watch_tk(self, root, name="Tk loop"):
+        """Keep a heartbeat running inside the Tk event loop."""
+        period = max(1, int(self.interval * 1000))
+
+        def tick():
+            self.beat(name)
+            root.after(period, tick)
+        tick()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+        logging.info(f"Watchdog started (threshold {self.threshold:.2f}s).")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                stalled = [(name, ident, now - since) for name, (ident, since) in
+                           list(self._active.items()) + list(self._beats.items())
+                           if now - since > self.threshold and name not in self._reported]
+                self._reported.update(name for name, _, _ in stalled)
+            if not stalled:
+                continue
+            frames = sys._current_frames()
+            for name, ident, blocked in stalled:
+                frame = frames.get(ident)
+                stack = format_stack(frame, 15) if frame is not None else "(thread gone)\n"
+                logging.warning(f"Watchdog: '{name}' blocked for {blocked:.2f}s:\n{stack}")
+
+
+profiler = SamplingProfiler()
+watchdog = Watchdog()
+_stack_file = None
+
+
+def install(stack_signal=getattr(signal, 'SIGUSR1', None), profile_signal=getattr(signal, 'SIGUSR2', None)):
+    """Register the signal handlers. Must be called from the main thread."""
+    global _stack_file
+    if stack_signal is None or profile_signal is None:
+        logging.warning("Diagnostics signals are not available on this platform.")
+        return
+    os.makedirs(diagnostics_dir, exist_ok=True)
+    if _stack_file is None:
+        # faulthandler needs a file that stays open
+        _stack_file = open(os.path.join(diagnostics_dir, 'stacks.log'), 'a')
+    faulthandler.register(stack_signal, file=_stack_file, all_threads=True, chain=False)
+
+    def toggle_profiler(signum, frame):
+        # Writing the profile may take a moment; keep it off the signal path
+        threading.Thread(target=profiler.toggle, name="profiler-toggle", daemon=True).start()
+
+    signal.signal(profile_signal, toggle_profiler)
+    logging.info(f"Diagnostics installed: kill -USR1 {os.getpid()} dumps stacks, "
+                 f"kill -USR2 {os.getpid()} toggles the profiler.")
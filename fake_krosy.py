@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+fake_krosy.py
+
+Local stand-in for the Krosy host (kssksun01) for integration and load
+tests. Speaks the same XML over TCP: type="1" requests are answered from
+ksk_pmod.json in the format of response.xml, type="2" results are
+acknowledged. Latency, packet splitting and dropped connections can be
+simulated.
+
+Usage:
+    python fake_krosy.py --port 10080 --latency 20 --split 3 --drop-rate 0.01
+    python fake_krosy.py --bench 5000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from krosy_client import AsyncKrosyClient, KrosyError, extract_response_id
+from krosy_messages import KrosyMessageBuilder
+
+# Terminal distance Krosy reports, as in response.xml. It is not the
+# stripping_length of ksk_pmod.json, so it is not echoed from there.
+DISTANCE = 20
+
+
+class FakeKrosyServer:
+    """Answers Krosy requests from the local KSK table."""
+
+    def __init__(self, ksk_pmod_path='ksk_pmod.json', latency=0.0, jitter=0.0, split=1,
+                 drop_rate=0.0, seed=None, distance=DISTANCE):
+        with open(ksk_pmod_path, 'r', encoding='utf-8') as f:
+            self.ksk_pmod = json.load(f)
+        self.latency = latency
+        self.jitter = jitter
+        self.split = max(1, split)
+        self.drop_rate = drop_rate
+        self.distance = distance
+        self.random = random.Random(seed)
+
+        self.requests = 0
+        self.results = 0
+        self.dropped = 0
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=10080):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"Fake Krosy listening on {host}:{self.port}.")
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        buffer = b""
+        write_lock = asyncio.Lock()
+        try:
+            while True:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                buffer += chunk
+                while True:
+                    end = buffer.find(b"</krosy>")
+                    if end == -1:
+                        break
+                    end += len(b"</krosy>")
+                    frame, buffer = buffer[:end], buffer[end:]
+                    # Answer concurrently so pipelined requests overlap like on the real host
+                    asyncio.ensure_future(self.respond(frame, writer, write_lock))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, frame, writer, write_lock):
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.dropped += 1
+            writer.close()
+            return
+
+        try:
+            reply = self.build_reply(ET.fromstring(frame))
+        except ET.ParseError as e:
+            logging.warning(f"Fake Krosy received malformed XML: {e}")
+            return
+
+        if self.split == 1:
+            if not writer.is_closing():
+                writer.write(reply)
+            return
+        # Deliver the reply in several TCP segments without interleaving other replies
+        step = -(-len(reply) // self.split)
+        async with write_lock:
+            for i in range(0, len(reply), step):
+                if writer.is_closing():
+                    return
+                writer.write(reply[i:i + step])
+                await writer.drain()
+                await asyncio.sleep(0.001)
+
+    def build_reply(self, root):
+        request_id = root.findtext("header/sourcehost/requestid", "0").strip()
+        source = root.findtext("header/sourcehost/hostname", "").strip()
+        ip = root.findtext("header/sourcehost/ip", "").strip()
+        mac = root.findtext("header/sourcehost/macaddress", "").strip()
+        body = root.find("body")
+        orders = body.findall("order") if body is not None else []
+
+        parts = []
+        for order in orders:
+            if order.get("type") == "1":
+                self.requests += 1
+                parts.append(self.data_response(order))
+            else:
+                self.results += 1
+                parts.append(
+                    f"<order id={quoteattr(order.get('id', '1'))} type=\"2\" state=\"1\" "
+                    f"scancode={quoteattr(order.get('scancode', ''))}/>\n"
+                )
+        return (
+            f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><krosy>\n<header>\n<sourcehost>\n"
+            f"<requestid>{request_id}</requestid>\n<hostname>{source}</hostname>\n"
+            f"<ip>{ip}</ip>\n<macaddress>{mac}</macaddress>\n</sourcehost>\n"
+            f"<targethost>\n<responseid>{request_id}</responseid>\n<hostname>{source}</hostname>\n"
+            f"</targethost>\n\n</header>\n"
+            f"<body device={quoteattr(source)} ordercount=\"{len(orders)}\">\n"
+            + "".join(parts)
+            + "</body></krosy> \n"
+        ).encode('utf-8')
+
+    def data_response(self, order):
+        scancode = order.get("scancode", "")
+        entry = self.ksk_pmod.get(scancode)
+        head = (
+            f"<order id={quoteattr(order.get('id', '1'))} type=\"1\" state=\"1\" "
+            f"scancode={quoteattr(scancode)} timestamp={quoteattr(order.get('timestamp', ''))}>\n"
+        )
+        if entry is None:
+            return head + "<response type=\"1\" state=\"-1\" amount=\"0\">\n<objects objectcount=\"0\">\n</objects> \n</response></order>"
+        return head + (
+            f"<response type=\"1\" state=\"1\" amount=\"1\">\n"
+            f"<info projekt=\"A56M\" ksknr={quoteattr(scancode)} kskindex=\"3\" lfdnr=\"0\">\n"
+            f"<ksident ident=\"\" ben1=\"_\" ben2=\"_\"/></info> \n"
+            f"<objects objectcount=\"1\">\n\n<object id=\"0\" state=\"0\">\n"
+            f"<terminal ident={quoteattr(entry['pmod'])} distance=\"{self.distance}\"></terminal> \n"
+            f"</object> \n\n</objects> \n</response></order>"
+        )
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def reply_matches(reply, request_id, scancode):
+    """True if reply carries request_id as its responseid and answers scancode."""
+    if extract_response_id(reply) != request_id:
+        return False
+    try:
+        order = ET.fromstring(reply).find("body/order")
+    except ET.ParseError:
+        return False
+    return order is not None and order.get("scancode") == scancode
+
+
+async def benchmark(server, total, concurrency, timeout):
+    """Drive the fake server with AsyncKrosyClient and report throughput and latency."""
+    client = AsyncKrosyClient('127.0.0.1', server.port, timeout=timeout,
+                              builder=KrosyMessageBuilder(ip_address='127.0.0.1'))
+    scancodes = list(server.ksk_pmod) or ["830569527899"]
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            scancode = scancodes[i % len(scancodes)]
+            request_id = client.next_request_id()
+            start = time.perf_counter()
+            try:
+                reply = await client.send(request_id, client.builder.data_request(request_id, scancode))
+            except KrosyError:
+                errors += 1
+                continue
+            if not reply_matches(reply, request_id, scancode):
+                # A reply for another request counts as a failure, not a fast answer
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await client.close()
+
+    latencies.sort()
+    print(f"requests:    {total} ({errors} failed) in {elapsed:.2f}s")
+    print(f"throughput:  {len(latencies) / elapsed:.0f} req/s at concurrency {concurrency}")
+    for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("max", 1.0)):
+        print(f"{label}:         {percentile(latencies, fraction) * 1000:.2f} ms")
+
+
+async def _main(args):
+    server = FakeKrosyServer(
+        args.ksk_pmod, args.latency / 1000, args.jitter / 1000, args.split, args.drop_rate, args.seed
+    )
+    await server.start(args.host, 0 if args.bench else args.port)
+    try:
+        if args.bench:
+            await benchmark(server, args.bench, args.concurrency, args.timeout)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Krosy stand-in server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=10080)
+    parser.add_argument('--ksk-pmod', default='ksk_pmod.json')
+    parser.add_argument('--latency', type=float, default=0.0, help="Response delay in ms")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random extra delay in ms")
+    parser.add_argument('--split', type=int, default=1, help="Split each reply into N writes")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Probability of dropping the connection")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--bench', type=int, default=0, help="Run N client requests against an in-process server")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
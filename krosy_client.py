@@ -0,0 +1,301 @@
+"""
+krosy_client.py
+
+Asyncio client for the Krosy MES link. Every request gets its own
+<requestid>, several requests can be in flight on one TCP connection and
+responses are matched back through header/targethost/responseid.
+
+Usage:
+    python krosy_client.py 830569527899 830569527810 ...
+"""
+
+import asyncio
+import itertools
+import logging
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+from krosy_messages import KrosyMessageBuilder
+
+host = "192.20.10.1"
+port = 10080
+
+# Highest request id before the counter wraps back to 1
+MAX_REQUEST_ID = 2**31 - 1
+
+
+class KrosyError(Exception):
+    """Raised when a Krosy request cannot be completed."""
+
+
+class KrosyTimeout(KrosyError):
+    """Raised when no response arrives before the request deadline."""
+
+
+def extract_response_id(frame):
+    """Return the header/targethost/responseid of a response frame, or None."""
+    try:
+        root = ET.fromstring(frame)
+    except ET.ParseError:
+        return None
+    response_id = root.findtext("header/targethost/responseid")
+    if response_id is None:
+        return None
+    try:
+        return int(response_id.strip())
+    except ValueError:
+        return None
+
+
+def parse_data_response(frame):
+    """
+    Extract the terminal data of a type="1" response.
+    Returns a dict with 'ident', 'distance' and 'projekt', or None if the
+    response carries no terminal for the scancode.
+    """
+    try:
+        root = ET.fromstring(frame)
+    except ET.ParseError:
+        return None
+    terminal = root.find("body/order/response/objects/object/terminal")
+    if terminal is None:
+        return None
+    ident = (terminal.get("ident") or "").strip()
+    if not ident:
+        return None
+    distance = terminal.get("distance")
+    try:
+        distance = float(distance)
+        distance = int(distance) if distance.is_integer() else distance
+    except (TypeError, ValueError):
+        distance = None
+    info = root.find("body/order/response/info")
+    return {
+        "ident": ident,
+        "distance": distance,
+        "projekt": info.get("projekt") if info is not None else None,
+    }
+
+
+class AsyncKrosyClient:
+    """Pipelined Krosy client sharing a single connection between callers."""
+
+    def __init__(self, host=host, port=port, timeout=2.0, connect_timeout=2.0, builder=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.builder = builder or KrosyMessageBuilder()
+
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._connect_lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+
+        # request id -> future, in send order
+        self._pending = {}
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def next_request_id(self):
+        """Return a request id that is not currently in flight."""
+        while True:
+            request_id = next(self._ids)
+            if request_id > MAX_REQUEST_ID:
+                self._ids = itertools.count(1)
+                continue
+            if request_id not in self._pending:
+                return request_id
+
+    async def connect(self):
+        """Open the connection if it is not already open."""
+        async with self._connect_lock:
+            if self.connected:
+                return
+            # A read loop of a dropped connection must not outlive it
+            await self._stop_read_task()
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port),
+                    self.connect_timeout,
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                raise KrosyError(f"Could not connect to {self.host}:{self.port}: {e}") from e
+            self._read_task = asyncio.ensure_future(self._read_loop(self._reader))
+            logging.info(f"Krosy connection established with {self.host}:{self.port}.")
+
+    async def close(self):
+        """Close the connection and fail everything still in flight."""
+        self._drop_connection(KrosyError("Connection closed."))
+        await self._stop_read_task()
+
+    async def _stop_read_task(self):
+        """Cancel the read loop of the previous connection and wait until it has ended."""
+        task, self._read_task = self._read_task, None
+        if task is None or task is asyncio.current_task():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def request(self, scancode, timeout=None):
+        """Send a type="1" request for scancode and return the response text."""
+        request_id = self.next_request_id()
+        return await self.send(request_id, self.builder.data_request(request_id, scancode), timeout)
+
+    async def send(self, request_id, xml_data, timeout=None):
+        """Send a pre-rendered message and wait for the response carrying request_id."""
+        if request_id in self._pending:
+            raise KrosyError(f"Request id {request_id} is already in flight.")
+        await self.connect()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            if isinstance(xml_data, str):
+                xml_data = xml_data.encode('utf-8')
+            self._writer.write(xml_data)
+            await self._writer.drain()
+            return await asyncio.wait_for(
+                future, self.timeout if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            raise KrosyTimeout(f"No response for request id {request_id}.") from None
+        except OSError as e:
+            # Fail the other requests on this connection; ours is reported by the raise below
+            self._pending.pop(request_id, None)
+            self._drop_connection(KrosyError(f"Connection lost: {e}"))
+            raise KrosyError(f"Failed to send request id {request_id}: {e}") from e
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_loop(self, reader):
+        """Split the incoming stream of reader into frames and resolve the matching futures."""
+        buffer = b""
+        try:
+            while True:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    raise KrosyError("Connection closed by server.")
+                buffer += chunk
+                while True:
+                    frame, buffer = self._split_frame(buffer)
+                    if frame is None:
+                        break
+                    self._dispatch(frame)
+        except asyncio.CancelledError:
+            raise
+        except (OSError, KrosyError) as e:
+            if reader is not self._reader:
+                # The connection was already dropped and possibly replaced
+                return
+            logging.warning(f"Krosy connection lost: {e}")
+            self._drop_connection(e if isinstance(e, KrosyError) else KrosyError(str(e)))
+
+    @staticmethod
+    def _split_frame(buffer):
+        """Return (frame, rest) for the first complete frame in buffer, or (None, buffer)."""
+        # Replies end in "</krosy> \n"; the whitespace must not prefix the next <?xml ...?>
+        buffer = buffer.lstrip()
+        end = buffer.find(b"</krosy>")
+        if end != -1:
+            end += len(b"</krosy>")
+            return buffer[:end], buffer[end:]
+        if buffer.startswith(b"ack"):
+            # Plain-text acknowledgement, as handled by connect_server in xml-test.py
+            return buffer[:3], buffer[3:]
+        return None, buffer
+
+    def _dispatch(self, frame):
+        response_id = extract_response_id(frame)
+        if response_id is not None or b"<responseid>" in frame:
+            # Tagged reply: only the request it names may have it, e.g. not the
+            # request after one that already timed out
+            future = self._pending.get(response_id)
+        else:
+            # Untagged reply (plain ack): the server answers in order, so it belongs to the oldest request
+            future = next((f for f in self._pending.values() if not f.done()), None)
+        if future is None:
+            logging.warning(f"Dropping unmatched Krosy response (responseid={response_id}).")
+            return
+        if not future.done():
+            future.set_result(frame.decode('utf-8', errors='replace'))
+
+    def _drop_connection(self, error):
+        if self._read_task is not None and self._read_task is not asyncio.current_task():
+            # Stopped here, awaited by the next connect() or close()
+            self._read_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+class KrosyLink:
+    """Runs an AsyncKrosyClient on a background event loop for threaded callers."""
+
+    def __init__(self, host=host, port=port, timeout=2.0):
+        self.client = AsyncKrosyClient(host, port, timeout=timeout, connect_timeout=timeout)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Started Krosy link thread for {host}:{port}.")
+
+    def submit(self, coro):
+        """Schedule a coroutine on the link loop and return a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def request(self, scancode, deadline):
+        """Blocking type="1" request that gives up after deadline seconds."""
+        return self._wait(self.client.request(scancode, deadline), deadline)
+
+    def send(self, request_id, xml_data, deadline):
+        """Blocking send of a pre-rendered message."""
+        return self._wait(self.client.send(request_id, xml_data, deadline), deadline)
+
+    def send_rendered(self, render, deadline):
+        """Blocking send of render(request_id), with the id allocated on the link loop."""
+        async def _send():
+            request_id = self.client.next_request_id()
+            return await self.client.send(request_id, render(request_id), deadline)
+        return self._wait(_send(), deadline)
+
+    def _wait(self, coro, deadline):
+        future = self.submit(asyncio.wait_for(coro, deadline))
+        try:
+            # The loop enforces the deadline; the slack only covers scheduling
+            return future.result(deadline + 0.5)
+        except (asyncio.TimeoutError, TimeoutError):
+            future.cancel()
+            raise KrosyTimeout(f"Krosy did not answer within {deadline}s.") from None
+
+    def close(self):
+        self.submit(self.client.close()).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+async def _main(scancodes):
+    client = AsyncKrosyClient()
+    try:
+        results = await asyncio.gather(
+            *(client.request(code) for code in scancodes), return_exceptions=True
+        )
+    finally:
+        await client.close()
+    for code, result in zip(scancodes, results):
+        print(f"--- {code} ---")
+        print(result)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    asyncio.run(_main(sys.argv[1:] or ["830569527899"]))
@@ -0,0 +1,244 @@
+"""
+krosy_journal.py
+
+Store-and-forward delivery of IO/NIO results to Krosy.
+
+Results are appended to an on-disk journal (one JSON record per line)
+and the cutting station carries on immediately. A background sender
+drains the journal in batches, several orders per <body ordercount=...>
+message, and records the delivered byte offset in a sidecar '.ack' file.
+Anything not yet acknowledged is re-sent after a restart, so results
+survive network outages and crashes.
+
+fsync policies:
+    'always'    fsync after every appended result
+    'interval'  fsync at most every fsync_interval seconds; a timer syncs
+                the tail of a burst, so no result stays unsynced for longer
+                than fsync_interval, even when the station goes idle
+    'never'     leave flushing to the operating system
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from krosy_client import KrosyError
+from krosy_messages import KrosyMessageBuilder, timestamp_now
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class ResultJournal:
+    """Append-only journal of result records with a persisted delivery offset."""
+
+    def __init__(self, path='krosy_results.journal', fsync='interval', fsync_interval=1.0,
+                 compact_size=1024 * 1024):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.path = path
+        self.ack_path = path + '.ack'
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_size = compact_size
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._last_fsync = 0.0
+        self._unsynced = False
+        self._sync_timer = None
+
+        # (end offset, record) for every result not yet acknowledged by Krosy
+        self._pending = deque()
+        self.acked_offset = self._read_ack_offset()
+        self._recover()
+        self._file = open(self.path, 'ab')
+
+    def _read_ack_offset(self):
+        try:
+            with open(self.ack_path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError as e:
+            logging.error(f"Corrupt journal offset in '{self.ack_path}', re-sending everything: {e}")
+            return 0
+
+    def _recover(self):
+        """Load unacknowledged records and cut off a torn last write."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            self.acked_offset = 0
+            return
+        if self.acked_offset > size:
+            self.acked_offset = 0
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.acked_offset)
+            offset = self.acked_offset
+            for line in f:
+                if not line.endswith(b'\n'):
+                    logging.warning(f"Dropping incomplete record at offset {offset} in '{self.path}'.")
+                    break
+                offset += len(line)
+                try:
+                    self._pending.append((offset, json.loads(line)))
+                except json.JSONDecodeError as e:
+                    logging.error(f"Skipping unreadable record in '{self.path}': {e}")
+        if offset < size:
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+        if self._pending:
+            logging.info(f"Recovered {len(self._pending)} undelivered Krosy results from '{self.path}'.")
+
+    def append(self, record):
+        """Durably queue one result record."""
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            now = time.monotonic()
+            if self.fsync == 'always' or (
+                self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval
+            ):
+                self._sync(now)
+            elif self.fsync == 'interval':
+                self._unsynced = True
+                self._schedule_sync(self._last_fsync + self.fsync_interval - now)
+            self._pending.append((self._file.tell(), record))
+            self._not_empty.notify()
+
+    def _sync(self, now):
+        os.fsync(self._file.fileno())
+        self._last_fsync = now
+        self._unsynced = False
+
+    def _schedule_sync(self, delay):
+        if self._sync_timer is None:
+            self._sync_timer = threading.Timer(delay, self._timed_sync)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _timed_sync(self):
+        """Timer callback: fsync whatever was appended since the last sync."""
+        with self._lock:
+            self._sync_timer = None
+            if self._unsynced and not self._file.closed:
+                self._sync(time.monotonic())
+
+    def wait_batch(self, max_items, linger=0.0, timeout=None):
+        """
+        Block until results are pending, then return up to max_items of them
+        as (end offset, records). linger gives a burst time to fill the batch.
+        """
+        with self._lock:
+            if not self._pending:
+                self._not_empty.wait(timeout)
+                if not self._pending:
+                    return None, []
+            if linger and len(self._pending) < max_items:
+                self._not_empty.wait(linger)
+            batch = [self._pending[i] for i in range(min(max_items, len(self._pending)))]
+        return batch[-1][0], [record for _, record in batch]
+
+    def commit(self, offset):
+        """Mark everything up to offset as delivered."""
+        with self._lock:
+            while self._pending and self._pending[0][0] <= offset:
+                self._pending.popleft()
+            self.acked_offset = offset
+            if not self._pending and offset >= self.compact_size:
+                # Everything is delivered: start the journal over
+                self._file.truncate(0)
+                self._file.seek(0)
+                os.fsync(self._file.fileno())
+                self.acked_offset = 0
+            self._write_ack_offset(self.acked_offset)
+
+    def _write_ack_offset(self, offset):
+        tmp_path = self.ack_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(offset))
+            f.flush()
+            if self.fsync != 'never':
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.ack_path)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def close(self):
+        with self._lock:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+            self._file.flush()
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def io_record(scancode, tident, distance):
+    return {"state": "io", "scancode": str(scancode), "tident": tident,
+            "distance": distance, "timestamp": timestamp_now()}
+
+
+def nio_record(scancode, tident, distance, error):
+    return {"state": "nio", "scancode": str(scancode), "tident": tident,
+            "distance": distance, "error": error, "timestamp": timestamp_now()}
+
+
+class ResultSender:
+    """Background thread that drains a ResultJournal to Krosy in batches."""
+
+    def __init__(self, journal, link, builder=None, batch_size=20, linger=0.2, deadline=5.0,
+                 retry_interval=2.0, max_retry_interval=60.0):
+        self.journal = journal
+        self.link = link
+        self.builder = builder or link.client.builder
+        self.batch_size = batch_size
+        self.linger = linger
+        self.deadline = deadline
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logging.info("Started Krosy result sender thread.")
+
+    def stop(self):
+        self._stop.set()
+
+    def render(self, request_id, records):
+        orders = []
+        for order_id, record in enumerate(records, 1):
+            if record["state"] == "io":
+                orders.append(KrosyMessageBuilder.io_order(
+                    order_id, record["scancode"], record["tident"], record["distance"], record["timestamp"]))
+            else:
+                orders.append(KrosyMessageBuilder.nio_order(
+                    order_id, record["scancode"], record["tident"], record["distance"],
+                    record.get("error") or "motor has an error", record["timestamp"]))
+        return self.builder.message(request_id, orders)
+
+    def run(self):
+        delay = self.retry_interval
+        while not self._stop.is_set():
+            offset, records = self.journal.wait_batch(self.batch_size, self.linger, timeout=1.0)
+            if not records:
+                continue
+            try:
+                self.link.send_rendered(lambda request_id: self.render(request_id, records), self.deadline)
+            except KrosyError as e:
+                logging.warning(f"Could not deliver {len(records)} Krosy results, retrying in {delay:.0f}s: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+            self.journal.commit(offset)
+            delay = self.retry_interval
+            logging.info(f"Delivered {len(records)} Krosy results ({len(self.journal)} pending).")
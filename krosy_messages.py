@@ -0,0 +1,125 @@
+"""
+krosy_messages.py
+
+Builds Krosy XML messages. The host identity (hostname, IP, MAC) is
+resolved once and the static header is rendered to bytes up front, so a
+message only costs filling in the request id and the order attributes.
+
+Message types:
+    type="1"                 data request for a scancode
+    type="2" state="3"       IO result
+    type="2" state="-101"    NIO result
+"""
+
+import datetime
+import logging
+import socket
+import uuid
+from xml.sax.saxutils import quoteattr
+
+hostname = "ksskringdistance01"
+targethost = "kssksun01"
+
+
+def get_mac_address():
+    # Retrieve the MAC address of the machine
+    mac = uuid.UUID(int=uuid.getnode()).hex[-12:]
+    return '-'.join([mac[e:e+2] for e in range(0, 12, 2)])
+
+
+def resolve_ip_address(name):
+    """Resolve name once; fall back to loopback if DNS is unavailable."""
+    try:
+        return socket.gethostbyname(name)
+    except OSError as e:
+        logging.warning(f"Could not resolve '{name}', using 127.0.0.1: {e}")
+        return "127.0.0.1"
+
+
+def timestamp_now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class KrosyMessageBuilder:
+    """Renders Krosy messages from a cached header."""
+
+    def __init__(self, hostname=hostname, targethost=targethost, ip_address=None, mac_address=None):
+        self.hostname = hostname
+        self.targethost = targethost
+        self.ip_address = ip_address or resolve_ip_address(hostname)
+        self.mac_address = mac_address or get_mac_address()
+
+        # Everything around <requestid> is static for the lifetime of the builder
+        self._head = b"<krosy>\n<header>\n<sourcehost>\n<requestid>"
+        self._tail = (
+            f"</requestid>\n"
+            f"<hostname>{self.hostname}</hostname>\n"
+            f"<ip>{self.ip_address}</ip>\n"
+            f"<macaddress>{self.mac_address}</macaddress>\n"
+            f"</sourcehost>\n"
+            f"<targethost>\n<hostname>{self.targethost}</hostname>\n</targethost>\n"
+            f"</header>\n"
+            f"<body device={quoteattr(self.hostname)} ordercount=\""
+        ).encode('utf-8')
+        self._end = b"</body>\n</krosy>\n"
+
+    def message(self, request_id, orders):
+        """Wrap pre-rendered order elements into a complete message."""
+        return b"".join((
+            self._head, str(request_id).encode('ascii'), self._tail,
+            str(len(orders)).encode('ascii'), b"\">\n",
+            *orders,
+            self._end,
+        ))
+
+    def data_request(self, request_id, scancode, timestamp=None):
+        """Render a type="1" request for scancode."""
+        return self.message(request_id, [self.data_order(1, scancode, timestamp)])
+
+    def io_result(self, request_id, scancode, tident, distance, timestamp=None):
+        """Render an IO result (state="3") for one order."""
+        return self.message(request_id, [self.io_order(1, scancode, tident, distance, timestamp)])
+
+    def nio_result(self, request_id, scancode, tident, distance, error="motor has an error", timestamp=None):
+        """Render an NIO result (state="-101") for one order."""
+        return self.message(
+            request_id, [self.nio_order(1, scancode, tident, distance, error, timestamp)]
+        )
+
+    @staticmethod
+    def data_order(order_id, scancode, timestamp=None):
+        timestamp = timestamp or timestamp_now()
+        return (
+            f"<order id=\"{order_id}\" scancode={quoteattr(str(scancode))} type=\"1\" state=\"1\" "
+            f"timestamp=\"{timestamp}\"/>\n"
+        ).encode('utf-8')
+
+    @staticmethod
+    def io_order(order_id, scancode, tident, distance, timestamp=None):
+        timestamp = timestamp or timestamp_now()
+        return (
+            f"<order id=\"{order_id}\" type=\"2\" state=\"3\" scancode={quoteattr(str(scancode))} "
+            f"timestamp=\"{timestamp}\" amountok=\"1\">\n"
+            f"<result>\n<objects objectcount=\"1\">\n<object id=\"1\" state=\"3\">\n"
+            f"<terminal ident={quoteattr(str(tident))} distance={quoteattr(str(distance))}></terminal>\n"
+            f"</object>\n</objects>\n</result>\n"
+            f"</order>\n"
+        ).encode('utf-8')
+
+    @staticmethod
+    def nio_order(order_id, scancode, tident, distance, error="motor has an error", timestamp=None):
+        timestamp = timestamp or timestamp_now()
+        return (
+            f"<order id=\"{order_id}\" type=\"2\" state=\"-101\" scancode={quoteattr(str(scancode))} "
+            f"timestamp=\"{timestamp}\" amountok=\"0\">\n"
+            f"<errors errorcount=\"1\" langu=\"en\">\n"
+            f"<error id=\"1\" message=\"Process with failure\"/>\n"
+            f"</errors>\n"
+            f"<result>\n<objects objectcount=\"1\">\n<object id=\"1\" state=\"-135\">\n"
+            f"<errors errorcount=\"1\" langu=\"en\">\n"
+            f"<error id=\"1\" message={quoteattr(str(error))}/>\n"
+            f"</errors>\n"
+            f"<terminal ident={quoteattr(str(tident))} distance={quoteattr(str(distance))}></terminal>\n"
+            f"</object>\n</objects>\n</result>\n"
+            f"</order>\n"
+        ).encode('utf-8')
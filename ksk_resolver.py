@@ -0,0 +1,133 @@
+"""
+ksk_resolver.py
+
+Resolves a scanned KSKNr to its PMOD entry for find_and_send_steps.
+
+Lookup order:
+    1. in-memory LRU cache with a TTL
+    2. Krosy (MES) with a tight deadline
+    3. the local compiled table (ksk_pmod.json)
+
+Whatever answers is written back to the cache. When Krosy fails, it is
+skipped for a short backoff period so an MES outage does not add the
+deadline to every scan.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from krosy_client import KrosyError, parse_data_response
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize=4096, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (hit, value). A cached None is a hit."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires, value = item
+            if expires < now:
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def put(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys=None):
+        """Drop the given keys, or everything if keys is None."""
+        with self._lock:
+            if keys is None:
+                self._data.clear()
+                return
+            for key in keys:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class KskResolver:
+    """Cache -> Krosy -> local table lookup of KSKNr to PMOD entries."""
+
+    def __init__(self, local_lookup, link=None, deadline=0.3, ttl=600, negative_ttl=30,
+                 maxsize=4096, backoff=30):
+        """
+        local_lookup: callable(ksk_str) -> entry dict or None
+        link: KrosyLink, or None to resolve from the local table only
+        """
+        self.local_lookup = local_lookup
+        self.link = link
+        self.deadline = deadline
+        self.negative_ttl = negative_ttl
+        self.backoff = backoff
+        self.cache = TTLCache(maxsize, ttl)
+        self._mes_down_until = 0.0
+
+    def resolve(self, ksk_str):
+        """Return the PMOD entry for ksk_str, or None if nobody knows it."""
+        hit, entry = self.cache.get(ksk_str)
+        if hit:
+            return entry
+
+        entry = self.query_mes(ksk_str)
+        source = "Krosy"
+        if entry is None:
+            entry = self.local_lookup(ksk_str)
+            source = "local table"
+
+        if entry is None:
+            # Remember misses briefly so repeated scans of an unknown KSK stay cheap
+            self.cache.put(ksk_str, None, self.negative_ttl)
+        else:
+            self.cache.put(ksk_str, entry)
+            logging.info(f"Resolved KSKNr {ksk_str} from {source}.")
+        return entry
+
+    def query_mes(self, ksk_str):
+        """
+        Ask Krosy for the terminal of ksk_str within the deadline. The entry
+        carries Krosy's PMOD and distance and the local stripping length.
+        """
+        if self.link is None or time.monotonic() < self._mes_down_until:
+            return None
+        try:
+            response = self.link.request(ksk_str, self.deadline)
+        except KrosyError as e:
+            self._mes_down_until = time.monotonic() + self.backoff
+            logging.warning(f"Krosy lookup failed for KSKNr {ksk_str}, using local table for {self.backoff}s: {e}")
+            return None
+
+        terminal = parse_data_response(response)
+        if terminal is None:
+            return None
+        # Krosy's terminal distance is not the stripping length (20 vs 104 for
+        # 830569527899); that still comes from the local table
+        local = self.local_lookup(ksk_str) or {}
+        return {
+            "pmod": terminal["ident"],
+            "stripping_length": local.get("stripping_length"),
+            "distance": terminal["distance"],
+        }
+
+    def invalidate(self, keys=None):
+        """Forget cached answers, e.g. after the local table was reloaded."""
+        self.cache.invalidate(keys)
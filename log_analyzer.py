@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+"""
+log_analyzer.py
+
+Offline analytics for application.log. The file is memory-mapped and
+streamed line by line; undecodable bytes are replaced, so the mixed
+text/binary log never stops the run. Memory stays bounded regardless of
+the log size.
+
+Scan sessions are rebuilt from the
+    "Extracted KSKNr" -> "Sent to machine" -> "Serial response"
+sequence and reported as:
+    - scans per hour
+    - scan-to-response gaps (count, mean, percentiles, max)
+    - bursts of serial errors
+    - the most frequent unknown KSKs
+
+Usage:
+    python log_analyzer.py [application.log] [--json] [--top 20]
+"""
+
+import argparse
+import bisect
+import heapq
+import json
+import mmap
+import re
+from collections import Counter
+from datetime import datetime
+
+LINE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) \[(\w+)\] (.*)$')
+
+SERIAL_ERROR_PREFIXES = (
+    "Serial communication error",
+    "Serial port is not open",
+    "Closed serial port due to communication error",
+    "Failed to open serial port",
+)
+
+# Upper bounds (ms) of the latency histogram buckets
+GAP_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 150, 200, 300, 500, 750, 1000, 1500, 2000, 5000, 10000]
+
+
+def iter_log_lines(path):
+    """Yield (timestamp, level, message) for every parsable line of a log file."""
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+        with mm:
+            for raw in iter(mm.readline, b""):
+                match = LINE_RE.match(raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+                if not match:
+                    continue
+                stamp, millis, level, message = match.groups()
+                ts = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S').timestamp() + int(millis) / 1000
+                yield ts, level, message
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram: constant memory, approximate percentiles."""
+
+    def __init__(self, buckets=GAP_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of samples."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, round(self.max, 1))
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 1) if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 1),
+        }
+
+
+class TopK:
+    """Space-saving heavy hitters: tracks the most frequent keys in bounded memory."""
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key):
+        if key in self.counts:
+            self.counts[key] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = 1
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            self.counts[key] = self.counts.pop(victim) + 1
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+
+class LogAnalyzer:
+    """Streams log lines and accumulates bounded-size statistics."""
+
+    def __init__(self, burst_window=60.0, burst_min=3, max_bursts=20, unknown_capacity=1000):
+        self.burst_window = burst_window
+        self.burst_min = burst_min
+        self.max_bursts = max_bursts
+
+        self.lines = 0
+        self.scans = 0
+        self.sent = 0
+        self.responses = Counter()
+        self.no_response = 0
+        self.per_hour = Counter()
+        self.gaps = LatencyHistogram()
+        self.unknown = TopK(unknown_capacity)
+
+        self._scan_ts = None
+        self._burst = None  # [start, end, count]
+        self._bursts = []   # min-heap of (count, start, end)
+
+    def feed(self, ts, level, message):
+        self.lines += 1
+        if message.startswith("Extracted KSKNr: "):
+            self.scans += 1
+            self._scan_ts = ts
+            self.per_hour[datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:00')] += 1
+        elif message.startswith("Sent to machine: "):
+            self.sent += 1
+        elif message.startswith("Serial response: "):
+            self.responses[message[len("Serial response: "):].strip()] += 1
+            self._close_session(ts)
+        elif message.startswith("No response from serial device"):
+            self.no_response += 1
+            self._close_session(ts)
+        elif message.startswith("No PMOD found for KSKNr: "):
+            self.unknown.add(message[len("No PMOD found for KSKNr: "):].strip())
+            self._scan_ts = None
+
+        if message.startswith(SERIAL_ERROR_PREFIXES) or "Could not open serial port" in message:
+            self._serial_error(ts)
+
+    def _close_session(self, ts):
+        # The station clock sometimes restarts at 1970; skip gaps across such jumps
+        if self._scan_ts is not None and ts >= self._scan_ts:
+            self.gaps.add((ts - self._scan_ts) * 1000)
+        self._scan_ts = None
+
+    def _serial_error(self, ts):
+        if self._burst and 0 <= ts - self._burst[1] <= self.burst_window:
+            self._burst[1] = ts
+            self._burst[2] += 1
+            return
+        self._finish_burst()
+        self._burst = [ts, ts, 1]
+
+    def _finish_burst(self):
+        if not self._burst or self._burst[2] < self.burst_min:
+            return
+        start, end, count = self._burst
+        item = (count, start, end)
+        if len(self._bursts) < self.max_bursts:
+            heapq.heappush(self._bursts, item)
+        else:
+            heapq.heappushpop(self._bursts, item)
+
+    def report(self, top=20):
+        self._finish_burst()
+        self._burst = None
+
+        def stamp(ts):
+            return datetime.fromtimestamp(ts).isoformat(sep=' ', timespec='seconds')
+
+        return {
+            "lines": self.lines,
+            "scans": self.scans,
+            "sent_to_machine": self.sent,
+            "serial_responses": dict(self.responses.most_common(top)),
+            "no_response": self.no_response,
+            "scans_per_hour": dict(sorted(self.per_hour.items())),
+            "scan_to_response": self.gaps.summary(),
+            "serial_error_bursts": [
+                {"start": stamp(start), "end": stamp(end), "errors": count}
+                for count, start, end in sorted(self._bursts, key=lambda b: b[1])
+            ],
+            "unknown_ksk": dict(self.unknown.most_common(top)),
+        }
+
+
+def analyze(path, **kwargs):
+    analyzer = LogAnalyzer(**kwargs)
+    for ts, level, message in iter_log_lines(path):
+        analyzer.feed(ts, level, message)
+    return analyzer
+
+
+def print_report(report):
+    print(f"Lines parsed:      {report['lines']}")
+    print(f"Scans:             {report['scans']}")
+    print(f"Sent to machine:   {report['sent_to_machine']}")
+    print(f"No serial reply:   {report['no_response']}")
+    gaps = report['scan_to_response']
+    print(f"Scan -> response:  n={gaps['count']} mean={gaps['mean_ms']} ms "
+          f"p50<={gaps['p50_ms']} p95<={gaps['p95_ms']} p99<={gaps['p99_ms']} max={gaps['max_ms']} ms")
+
+    print("\nScans per hour:")
+    for hour, count in report['scans_per_hour'].items():
+        print(f"  {hour}  {count:>5}")
+
+    print("\nSerial responses:")
+    for response, count in report['serial_responses'].items():
+        print(f"  {response:<20} {count:>5}")
+
+    print("\nSerial error bursts:")
+    for burst in report['serial_error_bursts']:
+        print(f"  {burst['start']} - {burst['end']}  {burst['errors']:>4} errors")
+
+    print("\nMost frequent unknown KSKs:")
+    for ksk, count in report['unknown_ksk'].items():
+        print(f"  {ksk:<16} {count:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze application.log.")
+    parser.add_argument('logfile', nargs='?', default='application.log')
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--burst-window', type=float, default=60.0, help="Seconds between errors of one burst")
+    parser.add_argument('--burst-min', type=int, default=3, help="Errors needed to count as a burst")
+    args = parser.parse_args()
+
+    report = analyze(args.logfile, burst_window=args.burst_window, burst_min=args.burst_min).report(args.top)
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
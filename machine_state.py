@@ -0,0 +1,70 @@
+"""
+machine_state.py
+
+Remembers the last position each motor controller acknowledged, per
+axis, so a move to the position it already holds can be skipped. The
+positions are forgotten whenever they can no longer be trusted: on
+(re)connect, when the controller reports BOOT_OK, and on any error or
+unexpected reply.
+"""
+
+import logging
+import threading
+
+# Axis ("V") the legacy single-value move addresses
+MAIN_AXIS = "2"
+
+# Replies that mean the controller has just restarted and lost its position
+BOOT_REPLIES = ("BOOT_OK",)
+
+# Replies of a controller firmware that does not know a command
+UNKNOWN_REPLIES = ("UNKNOWN_COMMAND",)
+
+
+def is_ack(response):
+    """True if response acknowledges a move (POS_OK, V2_OK, RELEASE_OK, ...)."""
+    return bool(response) and response.endswith("_OK") and response not in BOOT_REPLIES
+
+
+class MachineState:
+    """Last acknowledged step position per controller and axis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._positions = {}  # (controller, axis) -> steps
+
+    def pending(self, controller, setpoints):
+        """The part of setpoints {axis: steps} the controller does not already hold."""
+        with self._lock:
+            return {axis: steps for axis, steps in setpoints.items()
+                    if self._positions.get((controller, axis)) != steps}
+
+    def update(self, controller, steps, response, axis=MAIN_AXIS):
+        """Record the outcome of a move to steps that got response."""
+        return self.update_many(controller, {axis: steps}, response)
+
+    def update_many(self, controller, setpoints, response):
+        """Record the outcome of a (batched) move of several axes that got one response."""
+        with self._lock:
+            if is_ack(response):
+                for axis, steps in setpoints.items():
+                    self._positions[(controller, axis)] = steps
+                return True
+            # Any axis of the controller may have moved
+            if self._forget(controller):
+                logging.info(f"Forgot position of controller {controller} after reply {response!r}.")
+            return False
+
+    def invalidate(self, controller=None):
+        """Forget the positions of one controller, or of all of them."""
+        with self._lock:
+            if controller is None:
+                self._positions.clear()
+            else:
+                self._forget(controller)
+
+    def _forget(self, controller):
+        keys = [key for key in self._positions if key[0] == controller]
+        for key in keys:
+            del self._positions[key]
+        return bool(keys)
@@ -8,59 +8,124 @@ import platform
 import logging
 from datetime import datetime
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler("application.log"),
-        logging.StreamHandler()
-    ]
-)
+from krosy_client import KrosyLink
+from krosy_journal import ResultJournal, ResultSender, io_record, nio_record
+import calibration
+import diagnostics
+from calibration import CalibrationTable
+from compact_tables import CompactKskTable, load_ksk_table
+from config_diff import apply_diff, diff_tables
+from config_daemon import SharedConfigClosed, SharedConfigReader, shared_config_name
+from ksk_resolver import KskResolver
+from machine_state import BOOT_REPLIES, MAIN_AXIS, UNKNOWN_REPLIES, MachineState
+from predictor import KskPredictor
+from scan_history import ScanHistory
 
 # Set fullscreen to True to activate fullscreen mode
 fullscreen = True
 
+# Set krosy_enabled to False to resolve KSK numbers from ksk_pmod.json only
+krosy_enabled = True
+krosy_host = "192.20.10.1"
+krosy_port = 10080
+krosy_deadline = 0.3  # Seconds a scan may wait for Krosy before using the local table
+krosy_journal_path = 'krosy_results.journal'
+krosy_journal_fsync = 'interval'  # 'always', 'interval' or 'never'
+scan_history_path = 'scan_history.db'
+
+# Set use_db_calibration to True to apply the per-Ident coefficients of db.json
+use_db_calibration = False
+# Set use_distance_fallback to True to move PMODs without a lengthmm setting to the
+# output length hozzarendeles.json maps their Krosy distance to (else they do not move)
+use_distance_fallback = False
+
+# Move the motor to the predicted next position when the operator ends the cycle with
+# preposition_key. The time right after a scan is not idle (the harness is still being
+# stripped), so this stays off until it is driven by an explicit end-of-cycle signal.
+preposition_enabled = False
+preposition_key = "<F2>"
+
+# SIGUSR1 stack dumps, SIGUSR2 sampling profiler and a watchdog for stalls
+diagnostics_enabled = True
+watchdog_threshold = 2.0  # Seconds the scan handler or Tk loop may block before it is logged
+
+# Use the config published by config_daemon.py when it runs, else read the JSON files
+shared_config_enabled = True
+# Reloads changing more than this fraction of the KSKs swap in the parsed table instead of merging
+full_swap_fraction = 0.01
+
+# Send the setpoints of several axes as one {"M": [...]} command with a single ack.
+# Falls back to one command per axis if the controller does not know it.
+multi_axis_batching = True
+
+# Device paths, overridable from the environment (e.g. a FIFO for scan_replay.py)
+serial_port = os.environ.get('HV_SERIAL_PORT', '/dev/cino')  # Update this path as needed
+scanner_device = os.environ.get('HV_SCANNER_DEVICE', '/dev/scan')  # Update this path as needed
+
+def move_command(steps, axis=MAIN_AXIS):
+    """Build the JSON command that moves one controller axis to steps."""
+    return json.dumps({"V": axis, "S": str(steps)})
+
+def batch_command(setpoints):
+    """Build the JSON command that moves several axes {axis: steps} at once."""
+    return json.dumps({"M": [{"V": axis, "S": str(steps)} for axis, steps in sorted(setpoints.items())]})
+
+def extract_ksk_digits(raw_line):
+    """Return (decoded line, digits) for one raw scanner line."""
+    decoded_line = raw_line.decode('latin-1', errors='ignore').strip()
+    return decoded_line, ''.join(ch for ch in decoded_line if ch.isdigit())
+
+def configure_logging():
+    """Configure logging to application.log and the console."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        handlers=[
+            logging.FileHandler("application.log"),
+            logging.StreamHandler()
+        ]
+    )
+
+class HeadlessVar:
+    """Stand-in for tk.StringVar when the app runs without a window."""
+
+    def __init__(self, value=""):
+        self.value = value
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
 class SimpleSerialApp:
-    def __init__(self, master):
+    def __init__(self, master, serial_port=serial_port, scanner_device=scanner_device, watch_files=True):
+        """
+        master is the Tk root window, or None to run headless (no GUI),
+        as used by scan_replay.py. serial_port/scanner_device may be None
+        to leave the device unopened. watch_files=False skips the JSON
+        watcher thread, so reloads only happen when load_json_data() is called.
+        """
         self.master = master
-        self.master.title("Simple Serial App")
-
-        # Configure fullscreen based on the operating system
-        current_os = platform.system()
-        if current_os == 'Windows':
-            try:
-                self.master.state('zoomed')  # Windows
-                logging.info("Entered fullscreen mode on Windows.")
-            except Exception as e:
-                logging.error(f"Error setting fullscreen on Windows: {e}")
-        elif current_os in ['Linux', 'Darwin']:
-            try:
-                self.master.attributes('-fullscreen', fullscreen)  # Unix/Linux/Mac
-                logging.info(f"Entered fullscreen mode on {current_os}.")
-            except Exception as e:
-                # If '-fullscreen' doesn't work, manually set window size
-                screen_width = self.master.winfo_screenwidth()
-                screen_height = self.master.winfo_screenheight()
-                self.master.geometry(f"{screen_width}x{screen_height}+0+0")
-                logging.warning(f"Could not set fullscreen attribute on {current_os}: {e}")
-                logging.info(f"Set window size to {screen_width}x{screen_height}.")
-
-        # Exit fullscreen mode with the Escape key
-        self.master.bind("<Escape>", self.exit_fullscreen)
+        if self.master is not None:
+            self.setup_window()
 
         # Initialize serial port
         self.ser = None
-        self.serial_port = '/dev/cino'  # Update this path as needed
-        self.initialize_serial_port(self.serial_port)
-
-        # Start serial port monitor thread
-        threading.Thread(
-            target=self.monitor_serial_port, 
-            args=(self.serial_port,), 
-            daemon=True
-        ).start()
-        logging.info("Started serial port monitor thread.")
+        self.serial_lock = threading.Lock()
+        self.machine_state = MachineState()  # Last acknowledged position per controller axis
+        self.batching_supported = multi_axis_batching
+        self.serial_port = serial_port
+        if self.serial_port:
+            self.initialize_serial_port(self.serial_port)
+
+            # Start serial port monitor thread
+            threading.Thread(
+                target=self.monitor_serial_port, 
+                args=(self.serial_port,), 
+                daemon=True
+            ).start()
+            logging.info("Started serial port monitor thread.")
 
         # Initialize JSON data structures
         self.ksk_pmod = {}
@@ -74,24 +139,97 @@ class SimpleSerialApp:
 
         # Lock for thread-safe access to JSON data
         self.json_lock = threading.Lock()
+        # Serializes reloads, which parse and diff outside json_lock
+        self.reload_lock = threading.Lock()
+
+        # Shared-memory snapshot from config_daemon.py, if one is published
+        self.shared_config = None
+
+        # PMOD -> steps lookup, recompiled whenever the settings change
+        self.calibration = CalibrationTable(use_db_coefficients=use_db_calibration,
+                                            use_distance_fallback=use_distance_fallback)
+        self.calibration_mtime = self.get_calibration_mtime()
+
+        # KSKNr resolver: cache first, then Krosy, then the local ksk_pmod table
+        self.krosy_link = None
+        if krosy_enabled:
+            try:
+                self.krosy_link = KrosyLink(krosy_host, krosy_port, timeout=krosy_deadline)
+            except Exception as e:
+                logging.error(f"Could not start Krosy link, using local table only: {e}")
+        self.resolver = KskResolver(self.lookup_local_pmod, self.krosy_link, deadline=krosy_deadline)
+
+        # IO/NIO results are journaled to disk and delivered to Krosy in the background
+        self.result_journal = None
+        if self.krosy_link:
+            try:
+                self.result_journal = ResultJournal(krosy_journal_path, fsync=krosy_journal_fsync)
+                ResultSender(self.result_journal, self.krosy_link).start()
+            except Exception as e:
+                logging.error(f"Could not open Krosy result journal '{krosy_journal_path}': {e}")
+                self.result_journal = None
+
+        # Production history of every scan and move, written in the background
+        self.scan_history = ScanHistory(scan_history_path)
+
+        # Next-PMOD prediction for pre-positioning the motor while idle
+        self.predictor = KskPredictor()
+        self.last_scan = None  # (ksk_str, pmod_val, scan_seq) of the last completed scan
+        # Bumped by every scan; a pre-positioning move started for an older scan gives up
+        self.scan_seq = 0
 
         # Load initial JSON data
         self.load_json_data()
 
         # Create GUI components
-        self.create_widgets()
+        if self.master is not None:
+            self.create_widgets()
+        else:
+            self.scanned_var = HeadlessVar("HV")
+            self.steps_var = HeadlessVar()
+            self.stripping_var = HeadlessVar()
 
         # Start scanner thread
-        self.scanner_device = '/dev/scan'  # Update this path as needed
-        if os.path.exists(self.scanner_device):
+        self.scanner_device = scanner_device
+        if self.scanner_device and os.path.exists(self.scanner_device):
             threading.Thread(target=self.read_from_scanner, args=(self.scanner_device,), daemon=True).start()
             logging.info(f"Monitoring scanner device: {self.scanner_device}")
-        else:
+        elif self.scanner_device:
             logging.error(f"Scanner device not found: {self.scanner_device}")
 
         # Start JSON watcher thread
-        threading.Thread(target=self.watch_json_files, daemon=True).start()
-        logging.info("Started JSON watcher thread.")
+        if watch_files:
+            threading.Thread(target=self.watch_json_files, daemon=True).start()
+            logging.info("Started JSON watcher thread.")
+
+    def setup_window(self):
+        """Set the window title and fullscreen mode."""
+        self.master.title("Simple Serial App")
+
+        # Configure fullscreen based on the operating system
+        current_os = platform.system()
+        if current_os == 'Windows':
+            try:
+                self.master.state('zoomed')  # Windows
+                logging.info("Entered fullscreen mode on Windows.")
+            except Exception as e:
+                logging.error(f"Error setting fullscreen on Windows: {e}")
+        elif current_os in ['Linux', 'Darwin']:
+            try:
+                self.master.attributes('-fullscreen', fullscreen)  # Unix/Linux/Mac
+                logging.info(f"Entered fullscreen mode on {current_os}.")
+            except Exception as e:
+                # If '-fullscreen' doesn't work, manually set window size
+                screen_width = self.master.winfo_screenwidth()
+                screen_height = self.master.winfo_screenheight()
+                self.master.geometry(f"{screen_width}x{screen_height}+0+0")
+                logging.warning(f"Could not set fullscreen attribute on {current_os}: {e}")
+                logging.info(f"Set window size to {screen_width}x{screen_height}.")
+
+        # Exit fullscreen mode with the Escape key
+        self.master.bind("<Escape>", self.exit_fullscreen)
+        # The operator ends the cycle, the motor may move to the next position
+        self.master.bind(preposition_key, self.end_of_cycle)
 
     def initialize_serial_port(self, port, baudrate=9600, timeout=1, max_retries=5, retry_interval=5):
         """Initialize the serial port with reconnection logic."""
@@ -99,6 +237,7 @@ class SimpleSerialApp:
         while attempt < max_retries:
             try:
                 self.ser = serial.Serial(port, baudrate, timeout=timeout)
+                self.machine_state.invalidate(port)
                 logging.info(f"Serial port '{port}' successfully opened.")
                 return
             except serial.SerialException as e:
@@ -116,38 +255,152 @@ class SimpleSerialApp:
                 self.initialize_serial_port(port, baudrate, timeout)
             time.sleep(check_interval)
 
+    def attach_shared_config(self):
+        """Attach to the config daemon's segment; False if it is not running."""
+        try:
+            self.shared_config = SharedConfigReader(shared_config_name)
+            logging.info(f"Attached to shared config '{shared_config_name}'.")
+            return True
+        except (FileNotFoundError, ValueError, SharedConfigClosed):
+            return False
+
+    def load_shared_config(self):
+        """
+        Switch to a new shared generation; False if the daemon has gone away or
+        has not published a generation yet, so the JSON files are used meanwhile.
+        """
+        try:
+            snapshot = self.shared_config.poll()
+        except (SharedConfigClosed, TimeoutError) as e:
+            logging.warning(f"{e} Falling back to the JSON files.")
+            self.shared_config = None
+            # Force the files to be read again
+            self.ksk_pmod_mtime = None
+            self.pmod_settings_mtime = None
+            return False
+        if snapshot is None and self.shared_config.generation is None:
+            # Attached, but generation 0: nothing to read from the segment yet
+            return False
+        if snapshot is not None:
+            generation, ksk_pmod, pmod_settings = snapshot
+            with self.json_lock:
+                self.ksk_pmod = ksk_pmod
+            # The daemon swaps whole generations, so every cached answer is re-resolved
+            self.resolver.invalidate()
+            self.apply_pmod_settings(pmod_settings, f"shared generation {generation}")
+            logging.info(f"Loaded shared config generation {generation} ({len(self.ksk_pmod)} KSKs).")
+        return True
+
     def load_json_data(self):
-        """Load ksk_pmod.json and pmod_settings.json."""
+        """Load ksk_pmod.json and pmod_settings.json, or the shared snapshot of them."""
+        with self.reload_lock:
+            self._load_json_data()
+
+    def _load_json_data(self):
+        if shared_config_enabled and (self.shared_config or self.attach_shared_config()):
+            if self.load_shared_config():
+                self.reload_calibration_sources()
+                return
+
+        # Files are parsed outside json_lock so scans are not blocked by a large catalog
+        # Load ksk_pmod.json
+        try:
+            current_mtime = os.path.getmtime(self.ksk_pmod_path)
+            if self.ksk_pmod_mtime != current_mtime:
+                with open(self.ksk_pmod_path, 'r', encoding='utf-8') as f:
+                    # Interned records, see compact_tables.py. Sharing the previous
+                    # table's pool lets unchanged entries be diffed by index.
+                    ksk_pmod = load_ksk_table(f, getattr(self.ksk_pmod, 'pool', None))
+                self.ksk_pmod_mtime = current_mtime
+                self.apply_ksk_pmod(ksk_pmod)
+                logging.info(f"Loaded '{self.ksk_pmod_path}' successfully.")
+        except FileNotFoundError:
+            logging.error(f"File '{self.ksk_pmod_path}' not found.")
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON decode error in '{self.ksk_pmod_path}': {e}")
+        except Exception as e:
+            logging.error(f"Unexpected error loading '{self.ksk_pmod_path}': {e}")
+
+        # Load pmod_settings.json
+        try:
+            current_mtime = os.path.getmtime(self.pmod_settings_path)
+            if self.pmod_settings_mtime != current_mtime:
+                with open(self.pmod_settings_path, 'r', encoding='utf-8') as f:
+                    pmod_settings = json.load(f)
+                self.pmod_settings_mtime = current_mtime
+                self.apply_pmod_settings(pmod_settings, self.pmod_settings_path)
+                logging.info(f"Loaded '{self.pmod_settings_path}' successfully.")
+        except FileNotFoundError:
+            logging.error(f"File '{self.pmod_settings_path}' not found.")
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON decode error in '{self.pmod_settings_path}': {e}")
+        except Exception as e:
+            logging.error(f"Unexpected error loading '{self.pmod_settings_path}': {e}")
+
+        self.reload_calibration_sources()
+
+    def apply_ksk_pmod(self, ksk_pmod):
+        """Apply only the changed KSK entries and forget only their cached answers."""
+        old = self.ksk_pmod
+        if not (isinstance(old, CompactKskTable) and len(old)):
+            # First load, or switching over from the shared config
+            with self.json_lock:
+                self.ksk_pmod = ksk_pmod
+            self.resolver.invalidate()
+            return
+        diff = diff_tables(old, ksk_pmod)
+        if diff:
+            changed = diff.keys()
+            if len(changed) > len(old) * full_swap_fraction:
+                # A large import: the freshly parsed table already is the result
+                table = ksk_pmod
+            else:
+                # Merged outside json_lock; scans only wait for the swap
+                table = apply_diff(old, diff)
+            with self.json_lock:
+                self.ksk_pmod = table
+            self.resolver.invalidate(changed)
+        logging.info(f"Reloaded {diff.record(self.ksk_pmod_path)}")
+
+    def apply_pmod_settings(self, pmod_settings, source):
+        """Apply only the changed PMOD settings and recompute only their step targets."""
         with self.json_lock:
-            # Load ksk_pmod.json
+            if not self.pmod_settings:
+                self.pmod_settings = pmod_settings
+                self.calibration.compile(self.pmod_settings)
+                return
+        diff = diff_tables(self.pmod_settings, pmod_settings)
+        if diff:
+            with self.json_lock:
+                apply_diff(self.pmod_settings, diff)
+                self.calibration.update(self.pmod_settings, diff.keys())
+        logging.info(f"Reloaded {diff.record(source)}")
+
+    def reload_calibration_sources(self):
+        """Recompile when a calibration source changes."""
+        current_mtime = self.get_calibration_mtime()
+        if self.calibration_mtime != current_mtime:
+            self.calibration_mtime = current_mtime
+            with self.json_lock:
+                self.calibration.reload_sources()
+                self.calibration.compile(self.pmod_settings)
+            logging.info("Reloaded calibration sources.")
+
+    def get_calibration_mtime(self):
+        """Combined modification times of the calibration source files."""
+        mtimes = []
+        for path in (calibration.calibration_path, calibration.db_path,
+                     calibration.pass_table_path, calibration.distance_map_path):
             try:
-                current_mtime = os.path.getmtime(self.ksk_pmod_path)
-                if self.ksk_pmod_mtime != current_mtime:
-                    with open(self.ksk_pmod_path, 'r', encoding='utf-8') as f:
-                        self.ksk_pmod = json.load(f)
-                    self.ksk_pmod_mtime = current_mtime
-                    logging.info(f"Loaded '{self.ksk_pmod_path}' successfully.")
-            except FileNotFoundError:
-                logging.error(f"File '{self.ksk_pmod_path}' not found.")
-            except json.JSONDecodeError as e:
-                logging.error(f"JSON decode error in '{self.ksk_pmod_path}': {e}")
-            except Exception as e:
-                logging.error(f"Unexpected error loading '{self.ksk_pmod_path}': {e}")
+                mtimes.append(os.path.getmtime(path))
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
 
-            # Load pmod_settings.json
-            try:
-                current_mtime = os.path.getmtime(self.pmod_settings_path)
-                if self.pmod_settings_mtime != current_mtime:
-                    with open(self.pmod_settings_path, 'r', encoding='utf-8') as f:
-                        self.pmod_settings = json.load(f)
-                    self.pmod_settings_mtime = current_mtime
-                    logging.info(f"Loaded '{self.pmod_settings_path}' successfully.")
-            except FileNotFoundError:
-                logging.error(f"File '{self.pmod_settings_path}' not found.")
-            except json.JSONDecodeError as e:
-                logging.error(f"JSON decode error in '{self.pmod_settings_path}': {e}")
-            except Exception as e:
-                logging.error(f"Unexpected error loading '{self.pmod_settings_path}': {e}")
+    def lookup_local_pmod(self, ksk_str):
+        """Look up a KSKNr in the local ksk_pmod table."""
+        with self.json_lock:
+            return self.ksk_pmod.get(ksk_str)
 
     def watch_json_files(self):
         """Continuously watch JSON files for changes and reload them."""
@@ -257,14 +510,16 @@ class SimpleSerialApp:
         Find the PMOD for the given KSK number and send the corresponding lengthmm to the machine.
         Also retrieves and displays the stripping length.
         """
+        started = time.perf_counter()
+        self.scan_seq += 1
         ksk_str = str(ksk_number)
-        with self.json_lock:
-            pmod_entry = self.ksk_pmod.get(ksk_str)
+        pmod_entry = self.resolver.resolve(ksk_str)
 
         if not pmod_entry:
             logging.warning(f"No PMOD found for KSKNr: {ksk_str}")
             self.update_steps("")
             self.update_stripping_length("")
+            self.scan_history.record(ksk_str)
             return
 
         pmod_val = pmod_entry.get("pmod")
@@ -273,26 +528,120 @@ class SimpleSerialApp:
             logging.warning(f"No PMOD value found for KSKNr: {ksk_str}")
             self.update_steps("")
             self.update_stripping_length("")
+            self.scan_history.record(ksk_str)
             return
 
+        # Precompiled at reload, see calibration.py
         with self.json_lock:
-            steps_entry = self.pmod_settings.get(pmod_val)
-
-        if not steps_entry:
+            lengthmm = self.calibration.lengthmm_for(pmod_val)
+            steps = self.calibration.steps_for(pmod_val)
+            setpoints = self.calibration.setpoints_for(pmod_val)
+            fallback = self.calibration.distance_fallback(pmod_val, stripping_length) if steps is None else None
+
+        if fallback:
+            lengthmm, steps = fallback
+            setpoints[MAIN_AXIS] = steps
+            logging.info(f"No lengthmm setting for PMOD {pmod_val}, using output length {lengthmm} "
+                         f"of distance {stripping_length} from '{calibration.distance_map_path}'.")
+
+        if steps is None:
             logging.warning(f"No lengthmm setting found for PMOD: {pmod_val}")
             self.update_steps("")
             self.update_stripping_length("")
+            self.scan_history.record(ksk_str, pmod_val)
             return
 
-        lengthmm = steps_entry.get("lengthmm", 1)  # Default to 1 if not specified
-
         logging.info(f"PMOD for KSKNr {ksk_str}: {pmod_val}")
         logging.info(f"length for PMOD {pmod_val}: {lengthmm}")
         logging.info(f"Stripping Length for KSKNr {ksk_str}: {stripping_length}")
 
-        # Prepare the JSON command
-        to_send = json.dumps({"V": "2", "S": str((lengthmm-81.8)/0.02)}) # 80.5 itt szamitjuk a step/mm
+        # Only the axes that are not already in position are moved
+        response, result_error = self.send_setpoints(setpoints)
 
+        self.report_result(ksk_str, pmod_val, stripping_length, result_error)
+        self.scan_history.record(
+            ksk_str, pmod_val, lengthmm, steps, response or result_error,
+            (time.perf_counter() - started) * 1000,
+        )
+
+        # Update the 'length' and 'Stripping Length' labels
+        self.update_steps(lengthmm)
+        self.update_stripping_length(stripping_length)
+
+        self.predictor.observe(ksk_str, pmod_val)
+        self.last_scan = (ksk_str, pmod_val, self.scan_seq)
+
+    def send_setpoints(self, setpoints, scan_seq=None):
+        """
+        Move the axes {axis: steps} the controller does not already hold: one
+        legacy command for a single axis, one batched command with a single
+        combined ack for several. The held positions are checked under
+        serial_lock, so a move still in flight is never mistaken for the
+        position it is leaving.
+        scan_seq marks a speculative move, dropped if a scan arrived since.
+        Returns (response, error); error is None if the controller answered.
+        response is "SKIPPED" if nothing had to move, None if the speculative
+        move was dropped.
+        """
+        with self.serial_lock:
+            if scan_seq is not None and scan_seq != self.scan_seq:
+                return None, None
+            # A reboot between moves is only seen in the lines nobody asked for
+            self.drain_unsolicited()
+            pending = self.machine_state.pending(self.serial_port, setpoints)
+            if self.ser and self.ser.is_open and not pending:
+                # Re-scan of the current position: nothing to move
+                logging.info(f"Controller already at {setpoints}, move skipped.")
+                return "SKIPPED", None
+            setpoints = pending or setpoints
+
+            if len(setpoints) > 1 and self.batching_supported:
+                response, result_error = self.exchange(batch_command(setpoints))
+                if response in UNKNOWN_REPLIES:
+                    logging.warning("Controller does not support batched moves, sending one command per axis.")
+                    self.batching_supported = False
+                else:
+                    if response:
+                        self.machine_state.update_many(self.serial_port, setpoints, response)
+                    return response, result_error
+
+            response = result_error = None
+            for axis, steps in sorted(setpoints.items()):
+                response, result_error = self.exchange(move_command(steps, axis))
+                if response:
+                    self.machine_state.update(self.serial_port, steps, response, axis)
+                if result_error:
+                    break
+            return response, result_error
+
+    def drain_unsolicited(self):
+        """
+        Read the lines the controller sent on its own since the last exchange.
+        BOOT_OK or any other unexpected line means the held position is no
+        longer known. Called with serial_lock held.
+        """
+        try:
+            while self.ser and self.ser.is_open and self.ser.in_waiting:
+                line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+                if not line:
+                    continue
+                if line in BOOT_REPLIES:
+                    logging.warning(f"Controller rebooted ({line}), position forgotten.")
+                else:
+                    logging.warning(f"Unexpected serial line {line!r}, position forgotten.")
+                self.machine_state.invalidate(self.serial_port)
+        except (serial.SerialException, OSError) as e:
+            # exchange() reports and recovers from the broken port
+            logging.error(f"Could not read pending serial lines: {e}")
+            self.machine_state.invalidate(self.serial_port)
+
+    def exchange(self, to_send):
+        """
+        Write one command and read the controller's reply. Called with serial_lock held.
+        Returns (response, error); error is None if the controller answered.
+        """
+        response = None
+        result_error = None
         try:
             if self.ser and self.ser.is_open:
                 self.ser.write(to_send.encode('utf-8'))
@@ -303,10 +652,13 @@ class SimpleSerialApp:
                     logging.info(f"Serial response: {response}")
                 else:
                     logging.warning("No response from serial device.")
+                    result_error = "No response from motor controller"
             else:
                 logging.error("Serial port is not open.")
+                result_error = "Serial port is not open"
         except (serial.SerialException, OSError) as e:
             logging.error(f"Serial communication error: {e}")
+            result_error = f"motor has an error: {e}"
             if self.ser:
                 try:
                     self.ser.close()
@@ -316,10 +668,59 @@ class SimpleSerialApp:
             self.ser = None  # This will trigger the monitor thread to attempt reconnection
         except Exception as e:
             logging.error(f"Unexpected error during serial communication: {e}")
+            result_error = f"motor has an error: {e}"
+        if result_error:
+            self.machine_state.invalidate(self.serial_port)
+        return response, result_error
+
+    def end_of_cycle(self, event=None):
+        """Pre-position for the predicted next harness once the current one is done."""
+        if not preposition_enabled or self.last_scan is None:
+            return
+        # Serial I/O must not block the Tk loop
+        threading.Thread(target=self.preposition, args=self.last_scan, daemon=True).start()
 
-        # Update the 'length' and 'Stripping Length' labels
-        self.update_steps(lengthmm)
-        self.update_stripping_length(stripping_length)
+    def preposition(self, ksk_str, pmod_val, scan_seq):
+        """Speculatively move to the position of the predicted next PMOD, unless scan_seq is outdated."""
+        predicted = self.predictor.predict(ksk_str, pmod_val, self.lookup_local_pmod)
+        with self.json_lock:
+            steps = self.calibration.steps_for(predicted)
+            setpoints = self.calibration.setpoints_for(predicted)
+        if steps is None:
+            return
+        if scan_seq != self.scan_seq or not self.machine_state.pending(self.serial_port, setpoints):
+            # Early exit only; send_setpoints decides under serial_lock
+            return
+        logging.info(f"Pre-positioning for predicted PMOD {predicted}: {steps} steps "
+                     f"(prediction hit rate {self.predictor.hit_rate:.0%} over "
+                     f"{self.predictor.hits + self.predictor.misses} scans)")
+        if self.send_setpoints(setpoints, scan_seq) == (None, None):
+            logging.info(f"Pre-positioning for PMOD {predicted} dropped, a new KSK was scanned.")
+
+    def report_result(self, ksk_str, pmod_val, stripping_length, error=None):
+        """Queue an IO (error is None) or NIO result for delivery to Krosy."""
+        if not self.result_journal:
+            return
+        try:
+            if error is None:
+                self.result_journal.append(io_record(ksk_str, pmod_val, stripping_length))
+            else:
+                self.result_journal.append(nio_record(ksk_str, pmod_val, stripping_length, error))
+        except Exception as e:
+            logging.error(f"Could not journal Krosy result for KSKNr {ksk_str}: {e}")
+
+    def process_scan_line(self, raw_line):
+        """Extract the KSKNr from one raw scanner line and act on it."""
+        try:
+            decoded_line, digits = extract_ksk_digits(raw_line)
+            if digits:
+                with diagnostics.watchdog.track("scan handler"):
+                    logging.info(f"Scanned raw input: {decoded_line}")
+                    logging.info(f"Extracted KSKNr: {digits}")
+                    self.update_scanned_data(digits)
+                    self.find_and_send_steps(int(digits))
+        except Exception as decode_error:
+            logging.error(f"Decoding error: {decode_error}")
 
     def read_from_scanner(self, scanner_device):
         """Continuously read from the scanner device and process KSK numbers."""
@@ -329,24 +730,21 @@ class SimpleSerialApp:
                 while True:
                     raw_line = scanner.readline()
                     if raw_line:
-                        try:
-                            decoded_line = raw_line.decode('latin-1', errors='ignore').strip()
-                            digits = ''.join(ch for ch in decoded_line if ch.isdigit())
-                            if digits:
-                                logging.info(f"Scanned raw input: {decoded_line}")
-                                logging.info(f"Extracted KSKNr: {digits}")
-                                self.update_scanned_data(digits)
-                                self.find_and_send_steps(int(digits))
-                        except Exception as decode_error:
-                            logging.error(f"Decoding error: {decode_error}")
+                        self.process_scan_line(raw_line)
                     else:
                         time.sleep(0.1)  # Avoid busy waiting
         except Exception as e:
             logging.error(f"Error reading from scanner: {e}")
 
 def main():
+    configure_logging()
     root = tk.Tk()
     app = SimpleSerialApp(root)
+    if diagnostics_enabled:
+        diagnostics.install()
+        diagnostics.watchdog.threshold = watchdog_threshold
+        diagnostics.watchdog.watch_tk(root)
+        diagnostics.watchdog.start()
     root.mainloop()
 
 if __name__ == "__main__":
@@ -8,6 +8,8 @@ import platform
 import logging
 from datetime import datetime
 
+from config_daemon import SharedConfigClosed, SharedConfigReader, shared_config_name
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,6 +23,9 @@ logging.basicConfig(
 # Set fullscreen to True to activate fullscreen mode
 fullscreen = True
 
+# Use the config published by config_daemon.py when it runs, else read the JSON files
+shared_config_enabled = True
+
 class SimpleSerialApp:
     def __init__(self, master):
         self.master = master
@@ -75,6 +80,9 @@ class SimpleSerialApp:
         # Lock for thread-safe access to JSON data
         self.json_lock = threading.Lock()
 
+        # Shared-memory snapshot from config_daemon.py, if one is published
+        self.shared_config = None
+
         # Load initial JSON data
         self.load_json_data()
 
@@ -116,8 +124,46 @@ class SimpleSerialApp:
                 self.initialize_serial_port(port, baudrate, timeout)
             time.sleep(check_interval)
 
+    def attach_shared_config(self):
+        """Attach to the config daemon's segment; False if it is not running."""
+        try:
+            self.shared_config = SharedConfigReader(shared_config_name)
+            logging.info(f"Attached to shared config '{shared_config_name}'.")
+            return True
+        except (FileNotFoundError, ValueError, SharedConfigClosed):
+            return False
+
+    def load_shared_config(self):
+        """
+        Switch to a new shared generation; False if the daemon has gone away or
+        has not published a generation yet, so the JSON files are used meanwhile.
+        """
+        try:
+            snapshot = self.shared_config.poll()
+        except (SharedConfigClosed, TimeoutError) as e:
+            logging.warning(f"{e} Falling back to the JSON files.")
+            self.shared_config = None
+            # Force the files to be read again
+            self.ksk_pmod_mtime = None
+            self.pmod_settings_mtime = None
+            return False
+        if snapshot is None and self.shared_config.generation is None:
+            # Attached, but generation 0: nothing to read from the segment yet
+            return False
+        if snapshot is not None:
+            generation, ksk_pmod, pmod_settings = snapshot
+            with self.json_lock:
+                self.ksk_pmod = ksk_pmod
+                self.pmod_settings = pmod_settings
+            logging.info(f"Loaded shared config generation {generation} ({len(ksk_pmod)} KSKs).")
+        return True
+
     def load_json_data(self):
-        """Load ksk_pmod.json and pmod_settings.json."""
+        """Load ksk_pmod.json and pmod_settings.json, or the shared snapshot of them."""
+        if shared_config_enabled and (self.shared_config or self.attach_shared_config()):
+            if self.load_shared_config():
+                return
+
         with self.json_lock:
             # Load ksk_pmod.json
             try:
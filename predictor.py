@@ -0,0 +1,76 @@
+"""
+predictor.py
+
+Predicts the PMOD of the next harness so the motor can be pre-positioned
+while the station is idle.
+
+KSK numbers mostly arrive in runs (...27810, ...27811, ...) and
+consecutive harnesses usually share a PMOD, so the prediction is, in
+order:
+    1. the PMOD of the next KSK number in the compiled table
+    2. the most frequent successor PMOD seen in the recent scan history
+    3. the current PMOD
+"""
+
+import threading
+from collections import Counter, defaultdict, deque
+
+
+class KskPredictor:
+    """Next-PMOD prediction from the KSK table and recent scans."""
+
+    def __init__(self, history_size=200):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history_size)
+        self._transitions = defaultdict(Counter)
+        self.hits = 0
+        self.misses = 0
+        self._last_prediction = None
+
+    def observe(self, ksk_str, pmod):
+        """Record a confirmed scan and score the previous prediction."""
+        with self._lock:
+            if self._last_prediction is not None:
+                if self._last_prediction == pmod:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                self._last_prediction = None
+
+            if len(self._recent) == self._recent.maxlen:
+                # Forget the transition that falls out of the window
+                (_, old_from), (_, old_to) = self._recent[0], self._recent[1]
+                self._transitions[old_from][old_to] -= 1
+            if self._recent:
+                self._transitions[self._recent[-1][1]][pmod] += 1
+            self._recent.append((ksk_str, pmod))
+
+    def predict(self, ksk_str, pmod, lookup):
+        """
+        Return the likely PMOD of the scan after ksk_str.
+        lookup: callable(ksk_str) -> ksk_pmod entry or None
+        """
+        prediction = None
+        try:
+            next_entry = lookup(str(int(ksk_str) + 1))
+        except ValueError:
+            next_entry = None
+        if next_entry and next_entry.get("pmod"):
+            prediction = next_entry["pmod"]
+        else:
+            with self._lock:
+                successors = self._transitions.get(pmod)
+                if successors:
+                    candidate, count = successors.most_common(1)[0]
+                    if count > 0:
+                        prediction = candidate
+        if prediction is None:
+            prediction = pmod
+        with self._lock:
+            self._last_prediction = prediction
+        return prediction
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
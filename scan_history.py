@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""
+scan_history.py
+
+Indexed production history. Every scan and move is recorded as one row in
+a WAL-mode SQLite database. The scan path only puts the event on a queue;
+a writer thread commits events in batched transactions.
+
+Usage:
+    python scan_history.py report [--hours 8]     # harnesses per PMOD
+    python scan_history.py ksk 830569527814       # trace one KSKNr
+"""
+
+import argparse
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    ksknr TEXT NOT NULL,
+    pmod TEXT,
+    lengthmm REAL,
+    steps REAL,
+    response TEXT,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_scan_events_ts ON scan_events (ts);
+CREATE INDEX IF NOT EXISTS idx_scan_events_ksknr ON scan_events (ksknr, ts);
+CREATE INDEX IF NOT EXISTS idx_scan_events_pmod ON scan_events (pmod, ts);
+"""
+
+INSERT = (
+    "INSERT INTO scan_events (ts, ksknr, pmod, lengthmm, steps, response, latency_ms) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class ScanHistory:
+    """Asynchronous, batched writer for scan events."""
+
+    def __init__(self, path='scan_history.db', batch_size=100, flush_interval=1.0, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+        logging.info(f"Started scan history writer for '{path}'.")
+
+    def record(self, ksknr, pmod=None, lengthmm=None, steps=None, response=None, latency_ms=None, ts=None):
+        """Queue one scan event; never blocks the caller."""
+        event = (ts or time.time(), str(ksknr), pmod, lengthmm, steps, response, latency_ms)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            logging.warning(f"Scan history queue full, dropping event for KSKNr {ksknr}.")
+
+    def close(self, timeout=5):
+        """Flush queued events and stop the writer."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _writer(self):
+        try:
+            conn = connect(self.path)
+        except sqlite3.Error as e:
+            logging.error(f"Could not open scan history '{self.path}': {e}")
+            return
+        stopping = False
+        while not stopping:
+            try:
+                event = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while event is not None:
+                batch.append(event)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    event = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            stopping = event is None
+            if not batch:
+                continue
+            try:
+                with conn:
+                    conn.executemany(INSERT, batch)
+            except sqlite3.Error as e:
+                logging.error(f"Could not write {len(batch)} scan events: {e}")
+        conn.close()
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value).timestamp()
+
+
+def pmod_counts(conn, since, until=None):
+    """Return [(pmod, harnesses, scans)] between since and until (epoch seconds)."""
+    until = until or time.time()
+    return conn.execute(
+        "SELECT pmod, COUNT(DISTINCT ksknr), COUNT(*) FROM scan_events "
+        "WHERE ts >= ? AND ts < ? AND pmod IS NOT NULL GROUP BY pmod ORDER BY 2 DESC",
+        (since, until),
+    ).fetchall()
+
+
+def ksk_events(conn, ksknr):
+    """Return every recorded event for one KSKNr, oldest first."""
+    return conn.execute(
+        "SELECT ts, pmod, lengthmm, steps, response, latency_ms FROM scan_events "
+        "WHERE ksknr = ? ORDER BY ts",
+        (str(ksknr),),
+    ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the scan history database.")
+    parser.add_argument('--db', default='scan_history.db')
+    sub = parser.add_subparsers(dest='command', required=True)
+    report = sub.add_parser('report', help="Harnesses per PMOD in a time window")
+    report.add_argument('--hours', type=float, default=8.0)
+    report.add_argument('--since', help="ISO start time, overrides --hours")
+    report.add_argument('--until', help="ISO end time")
+    trace = sub.add_parser('ksk', help="All events for one KSKNr")
+    trace.add_argument('ksknr')
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == 'report':
+        since = parse_time(args.since) if args.since else time.time() - args.hours * 3600
+        until = parse_time(args.until) if args.until else None
+        print(f"{'PMOD':<12}{'harnesses':>10}{'scans':>8}")
+        for pmod, harnesses, scans in pmod_counts(conn, since, until):
+            print(f"{pmod:<12}{harnesses:>10}{scans:>8}")
+    else:
+        for ts, pmod, lengthmm, steps, response, latency_ms in ksk_events(conn, args.ksknr):
+            stamp = datetime.fromtimestamp(ts).isoformat(timespec='milliseconds')
+            latency = f"{latency_ms:.0f} ms" if latency_ms is not None else "-"
+            print(f"{stamp}  {pmod or '-':<10} {lengthmm!s:>7} {steps!s:>8}  {response or '-':<12} {latency}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""
+scan_replay.py
+
+Replays a recorded shift of scans into the station, at the recorded pace
+(--speed 1), N times faster (--speed N) or as fast as possible
+(--speed 0).
+
+Sources:
+    --log application.log        "Scanned raw input" lines of the app log
+    --history scan_history.db    events recorded by scan_history.py
+
+Targets:
+    --fifo PATH     write the scans into a FIFO/pty that a running main.py
+                    reads as its scanner (start it with HV_SCANNER_DEVICE=PATH)
+    --headless      drive an in-process SimpleSerialApp without a window,
+                    against a simulated motor controller
+
+Usage:
+    python scan_replay.py --log application.log --headless --speed 0
+    mkfifo /tmp/scan && HV_SCANNER_DEVICE=/tmp/scan python main.py &
+    python scan_replay.py --log application.log --fifo /tmp/scan --speed 10
+"""
+
+import argparse
+import logging
+import sqlite3
+import time
+
+from log_analyzer import iter_log_lines
+
+
+def scans_from_log(path):
+    """Yield (timestamp, raw scanner line) from an application log."""
+    prefix = "Scanned raw input: "
+    for ts, level, message in iter_log_lines(path):
+        if message.startswith(prefix):
+            yield ts, message[len(prefix):]
+
+
+def scans_from_history(path):
+    """Yield (timestamp, KSKNr) from a scan history database."""
+    conn = sqlite3.connect(path)
+    try:
+        for ts, ksknr in conn.execute("SELECT ts, ksknr FROM scan_events ORDER BY ts"):
+            yield ts, ksknr
+    finally:
+        conn.close()
+
+
+def schedule(scans, speed, max_gap):
+    """
+    Yield (offset, line) with the replay offset in seconds from the start.
+    Gaps are divided by speed and capped at max_gap; backwards clock jumps
+    (e.g. to 1970 after a cold boot) count as no gap.
+    """
+    offset = 0.0
+    previous = None
+    for ts, line in scans:
+        if previous is not None and speed > 0:
+            offset += min(max(ts - previous, 0.0), max_gap) / speed
+        previous = ts
+        yield offset, line
+
+
+class SimulatedController:
+    """Answers like the motor controller over serial, with a fixed reply delay."""
+
+    def __init__(self, reply="POS_OK", delay=0.0):
+        self.reply = reply.encode('utf-8') + b"\n"
+        self.delay = delay
+        self.is_open = True
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return len(data)
+
+    def readline(self):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.reply
+
+    def close(self):
+        self.is_open = False
+
+
+class FifoTarget:
+    """Writes scan lines to a FIFO or pty, as the barcode scanner would."""
+
+    def __init__(self, path):
+        # Opening a FIFO blocks until the station opens its end
+        self.file = open(path, 'wb', buffering=0)
+
+    def feed(self, line):
+        self.file.write(line.encode('latin-1', errors='replace') + b"\n")
+
+    def close(self):
+        self.file.close()
+
+
+class HeadlessTarget:
+    """Feeds scan lines straight into a window-less SimpleSerialApp."""
+
+    def __init__(self, controller_delay=0.0, krosy=False, history_path=':memory:'):
+        import main
+        main.krosy_enabled = krosy
+        main.scan_history_path = history_path
+        self.app = main.SimpleSerialApp(None, serial_port=None, scanner_device=None)
+        self.app.ser = SimulatedController(delay=controller_delay)
+
+    def feed(self, line):
+        self.app.process_scan_line(line.encode('latin-1', errors='replace') + b"\n")
+
+    def close(self):
+        self.app.scan_history.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def replay(scans, target, speed=1.0, max_gap=60.0, limit=None):
+    """Feed scans into target on schedule; return per-scan handling times and lag."""
+    handle_times = []
+    lags = []
+    started = time.perf_counter()
+    for count, (offset, line) in enumerate(schedule(scans, speed, max_gap)):
+        if limit is not None and count >= limit:
+            break
+        wait = started + offset - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        lags.append(max(0.0, -wait))
+        t0 = time.perf_counter()
+        target.feed(line)
+        handle_times.append(time.perf_counter() - t0)
+    return handle_times, lags, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded scans into the station.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--log', default='application.log', help="Replay from an application log")
+    source.add_argument('--history', help="Replay from a scan history database")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--fifo', help="Scanner FIFO/pty of a running main.py")
+    target.add_argument('--headless', action='store_true', help="Drive an in-process app without a window")
+    parser.add_argument('--speed', type=float, default=1.0, help="1 = recorded pace, N = N times faster, 0 = flat out")
+    parser.add_argument('--max-gap', type=float, default=60.0, help="Cap on recorded idle gaps, in seconds")
+    parser.add_argument('--limit', type=int, default=None, help="Stop after this many scans")
+    parser.add_argument('--controller-delay', type=float, default=0.0, help="Simulated controller reply time (headless)")
+    parser.add_argument('--krosy', action='store_true', help="Let the headless app query Krosy")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    scans = scans_from_history(args.history) if args.history else scans_from_log(args.log)
+    if args.fifo:
+        sink = FifoTarget(args.fifo)
+    else:
+        sink = HeadlessTarget(args.controller_delay, args.krosy)
+    try:
+        handle_times, lags, elapsed = replay(scans, sink, args.speed, args.max_gap, args.limit)
+    finally:
+        sink.close()
+
+    handle_times.sort()
+    lags.sort()
+    print(f"Replayed {len(handle_times)} scans in {elapsed:.2f}s (speed {args.speed or 'max'})")
+    if handle_times:
+        print(f"Feed time:  p50={percentile(handle_times, 0.5) * 1000:.2f} ms "
+              f"p99={percentile(handle_times, 0.99) * 1000:.2f} ms max={handle_times[-1] * 1000:.2f} ms")
+        if args.speed > 0:
+            print(f"Lag behind schedule: p99={percentile(lags, 0.99) * 1000:.2f} ms max={lags[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
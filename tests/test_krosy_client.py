@@ -0,0 +1,76 @@
+"""
+Response routing of AsyncKrosyClient against the in-process fake Krosy server.
+
+Run with:
+    python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_krosy import FakeKrosyServer  # noqa: E402
+from krosy_client import AsyncKrosyClient, KrosyTimeout, extract_response_id  # noqa: E402
+
+KSK_PMOD_PATH = os.path.join(ROOT, 'ksk_pmod.json')
+
+
+def reply_scancode(reply):
+    order = ET.fromstring(reply).find("body/order")
+    return order.get("scancode") if order is not None else None
+
+
+class AsyncKrosyClientTest(unittest.TestCase):
+
+    def run_with_server(self, scenario, latency=0.0):
+        async def _run():
+            server = FakeKrosyServer(KSK_PMOD_PATH, latency=latency, seed=1)
+            await server.start(port=0)
+            client = AsyncKrosyClient('127.0.0.1', server.port, timeout=2.0)
+            try:
+                return await scenario(client)
+            finally:
+                await client.close()
+                await server.stop()
+        return asyncio.run(_run())
+
+    def test_late_reply_is_not_given_to_next_request(self):
+        async def scenario(client):
+            with self.assertRaises(KrosyTimeout):
+                await client.request("830569527899", timeout=0.3)
+            # The first reply lands 0.1 s into this request and must be dropped
+            return await client.request("830569527810", timeout=1.0)
+
+        reply = self.run_with_server(scenario, latency=0.4)
+        self.assertEqual(reply_scancode(reply), "830569527810")
+
+    def test_pipelined_replies_reach_their_requests(self):
+        scancodes = ["830569527899", "830569527810"] * 100
+
+        async def scenario(client):
+            ids = [client.next_request_id() for _ in scancodes]
+            replies = await asyncio.gather(*(
+                client.send(request_id, client.builder.data_request(request_id, code))
+                for request_id, code in zip(ids, scancodes)
+            ))
+            return ids, replies
+
+        ids, replies = self.run_with_server(scenario)
+        for request_id, code, reply in zip(ids, scancodes, replies):
+            self.assertEqual(extract_response_id(reply), request_id)
+            self.assertEqual(reply_scancode(reply), code)
+
+    def test_split_frame_skips_trailing_whitespace(self):
+        frame, rest = AsyncKrosyClient._split_frame(b" \n<krosy>x</krosy> \nack")
+        self.assertEqual(frame, b"<krosy>x</krosy>")
+        frame, rest = AsyncKrosyClient._split_frame(rest)
+        self.assertEqual((frame, rest), (b"ack", b""))
+
+
+if __name__ == '__main__':
+    unittest.main()
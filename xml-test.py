@@ -6,9 +6,9 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'Lib'))
 
 # Import the manually added module
 import requests
-import datetime
 import socket
-import uuid
+
+from krosy_messages import KrosyMessageBuilder
 
 request_type = "request_data"
 scancode = "830569527899"
@@ -20,11 +20,6 @@ targethost = "kssksun01"
 tident = "P8378691"
 sdistance = "20"
 
-def get_mac_address():
-    # Retrieve the MAC address of the machine
-    mac = uuid.UUID(int=uuid.getnode()).hex[-12:]
-    return '-'.join([mac[e:e+2] for e in range(0, 12, 2)])
-
 def connect_server(scancode, host, port, next_callback):
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
@@ -79,94 +74,20 @@ def send_request(xml_data, url):
             file.write(str(e))
         return str(e)
 
-def create_xml_request(scancode):
-    mac_address = get_mac_address()
-    
-    ip_address = socket.gethostbyname("ksskringdistance01")
-    timestamp = datetime.datetime.now().isoformat(timespec="seconds")
-
-    xml_request_data = f"""
-    <krosy>
-        <header>
-            <sourcehost>
-                <requestid>1</requestid>
-                <hostname>{hostname}</hostname>
-                <ip>{ip_address}</ip>
-                <macaddress>{mac_address}</macaddress>
-            </sourcehost>
-        <targethost>
-            <hostname>{targethost}</hostname>
-        </targethost>
-        </header>
-        <body device="{hostname}" ordercount="1">
-            <order id="1" scancode="{scancode}" type="1" state="1" timestamp="{timestamp}"/>
-        </body>
-    </krosy>
-    """
-
-    xml_request_io = f"""
-    <krosy>
-        <header>
-            <sourcehost>
-                <requestid>2</requestid>
-                <hostname>{hostname}</hostname>
-                <ip>{ip_address}</ip>
-                <macaddress>{mac_address}</macaddress>
-            </sourcehost>
-            <targethost>
-                <hostname>{targethost}</hostname>
-            </targethost>
-        </header>
-        <body device="{hostname}" ordercount="1">
-            <order id="1" type="2" state="3" scancode="{scancode}" timestamp="{timestamp}" amountok="1">
-                <result>
-                    <objects objectcount="1">
-                        <object id="1" state="3">
-                                <terminal ident="{tident}" distance="{sdistance}">
-                                </terminal>
-                        </object>
-                    </objects>
-                </result>		
-            </order>
-        </body>
-    </krosy>
-    """
-
-    xml_request_nio = f"""
-    <krosy>
-        <header>
-            <sourcehost>
-                <requestid>3</requestid>
-                <hostname>{hostname}</hostname>
-                <ip>{ip_address}</ip>
-                <macaddress>{mac_address}</macaddress>
-            </sourcehost>
-            <targethost>
-                <hostname>{targethost}</hostname>
-            </targethost>
-        </header>
-        <body device="{hostname}" ordercount="1">
-            <order id="1" type="2" state="-101" scancode="{scancode}" timestamp="{timestamp}" amountok="0">
-                <errors errorcount="1" langu="en">
-                    <error id="1" message="Process with failure"/> 
-                </errors>
-                <result>
-                    <objects objectcount="1">
-                        <object id="1" state="-135">					
-                            <errors errorcount="1" langu="en">					
-                                <error id="1" message="motor has an error"/>
-                            </errors>
-                            <terminal ident="{tident}" distance="{sdistance}">
-                                </terminal>
-                        </object>
-                    </objects>
-                </result>		
-            </order>
-        </body>
-    </krosy>
-    """
-    
-    return xml_request_data
+_builder = None
+
+def get_builder():
+    # Host identity is resolved once per process, not per request
+    global _builder
+    if _builder is None:
+        _builder = KrosyMessageBuilder(hostname, targethost)
+    return _builder
+
+def create_xml_request(scancode, request_id=1):
+    builder = get_builder()
+    if mode == "Result":
+        return builder.io_result(request_id, scancode, tident, sdistance).decode('utf-8')
+    return builder.data_request(request_id, scancode).decode('utf-8')
 
 if __name__ == "__main__":
 